@@ -1,13 +1,7 @@
-from src import ahc_download_tools
-from src import ahc_analyze
-
-import subprocess
-import toml
+# 起動を軽くするため、重いモジュール (subprocess, toml, asyncio, requests, numpy, ...) は使うコマンドの中で import する
 import sys
 import os
 from pathlib import Path
-import webbrowser
-import asyncio
 
 
 RESOURCEDIR = "src"
@@ -15,15 +9,47 @@ CONTEST_SOURCECODEDIR = "contest"
 CONTEST_TEMPLATEDIR = "template"
 CONTEST_RESOURCE = "contest"
 
-PALLALEL = 10
-TIMEOUT = "timeout 5s"
+TIMEOUT = 5.0
 
 USAGE  ="""
 # usage: 
 # python manage.py abc301 new
 # python manage.py abc301 open a
+# python manage.py abc301 prefetch         (全タスクのサンプルと AHC のツールを並列に取ってキャッシュする)
 # python manage.py abc301 python test a
 # python manage.py ahc024 python test
+# python manage.py ahc024 python test a --seeds=1000 --parallel=8 --minimize
+# python manage.py abc301 python test a --backend=server
+# python manage.py ahc024 python test a --compare=best
+# python manage.py ahc024 python test a --profile=5   (遅い 5 シードをプロファイルして result/<date>/profile.folded と summary.txt に残す)
+# python manage.py ahc024 compare a best latest
+# python manage.py abc301 python watch a
+# python manage.py abc301 python test a   (contest/abc301/a_judge.py があればインタラクティブ、src/interactive.py)
+# python manage.py abc301 python make_samples a 100000   (a_gen.py と a_naive.py で解答を試し、食い違ったら縮めて test/ に足す)
+# python manage.py abc301 bench a --repeat=5   (python / pypy / rust のうちあるものを全部流して実行時間を比べる)
+# python manage.py ahc024 python tune a --trials=16
+# python manage.py ahc024 render a latest 12 34   (vis の生成物を result/<date>/vis/ に置く、シードを省くと悪い方から --worst=5 個)
+# python manage.py ahc024 rust test a --seeds=2000 --workers=4   (ワーカに分けて流す、src/ahc_worker.py)
+# python src/startup_budget.py   (起動時間の予算チェック)
+#
+# contest/<contest>/config.toml に設定を書ける ([a] のようにタスクごとにも書ける)
+# time_limit = 2.0      # 秒
+# memory_limit = 1024   # MB
+# warn_ratio = 0.8      # 制限のこの割合を超えたシードを警告する
+# parallel = 2          # サンプルを同時に流す数 (既定はコア数と compose.yml の cpus の小さい方)
+# timeout = 5.0         # サンプル 1 つの打ち切り時間 (秒)
+# abs_tol = 1e-6        # 小数の出力を許容誤差つきで比べる
+# rel_tol = 1e-6
+# first_failure = true  # 最初に落ちたところで止める
+# smoke_seeds = 10      # watch で AHC のときに流すシード数
+# base_url = "https://atcoder.jp"  # prefetch / open で問題を取ってくる先
+# workers = 4           # AHC のシードを流すローカルのワーカプロセスの数
+# listen = "0.0.0.0:7000"  # リモートのワーカを待ち受けるアドレス (ループバック以外は環境変数 AHC_WORKER_KEY が必要)
+# repeat = 5            # bench でサンプルごとに流す回数 (AHC は bench_seeds = 10 個のシード)
+# interactive = "container"  # AHC の tester もコンテナ内で動かし、解答とパイプで直接つなぐ (ホストでビルドした tester がコンテナで動くときだけ)
+# time_budget = 1.5    # ahcsubmit の budget で選ぶ run の実行時間の上限 (既定は time_limit)
+# tune_seeds = 100      # tune で最後の段まで残った trial に流すシード数
+# [tune]                # tune で探索するパラメータ (環境変数で渡す、書き方は src/ahc_tune.py)
 """
 
 # 一番上のインタプリタがデフォルトになる
@@ -58,6 +84,13 @@ if len(argv) < 3:
 contest_name = sys.argv[1]
 argv = sys.argv[2:]
 
+# --key=value 形式のオプション
+OPTIONS = {}
+for a in [a for a in argv if a.startswith("--")]:
+    k, _, v = a[2:].partition("=")
+    OPTIONS[k] = v if v else True
+    argv.remove(a)
+
 interpreter = ""
 
 class Contest:
@@ -66,6 +99,8 @@ class Contest:
         self.__interpreter = interpreter
         self.__contest_name = contest_name
         self.__taskname = taskname
+        self.__config = None
+        self.__last_failed = None
         
     @property
     def contest_name(self):
@@ -87,7 +122,31 @@ class Contest:
     def source_path(self):
         return Path(CONTEST_SOURCECODEDIR) / self.__contest_name / f"{self.__taskname}.{EXTENSIONS[self.__interpreter]}"
     
+    @property
+    def config(self):
+        # contest/<contest>/config.toml、[<task>] の表でタスクごとに上書きできる
+        if self.__config is None:
+            self.__config = {}
+            path = Path(CONTEST_SOURCECODEDIR) / self.__contest_name / "config.toml"
+            if path.exists():
+                import toml
+                data = toml.load(path)
+                # [tune] (パラメータの探索範囲) だけは表のまま持つ
+                self.__config = {k: v for k, v in data.items() if not isinstance(v, dict) or k == "tune"}
+                self.__config.update(data.get(self.__taskname, {}))
+        return self.__config
+    
+    def setting(self, key, default):
+        # --key=value > config.toml > default
+        if key in OPTIONS:
+            value = OPTIONS[key]
+            if isinstance(default, bool):
+                return value is True or value.lower() not in ("0", "false", "no")
+            return type(default)(value) if default is not None else value
+        return self.config.get(key, default)
+    
     def __change_cargoyaml(self):
+        import toml
         cargopath = (Path(CONTEST_SOURCECODEDIR) / "Cargo.toml")
         with open(cargopath, "r") as f:
             data = toml.load(f)
@@ -95,12 +154,34 @@ class Contest:
             if 'name' in bin_section and 'path' in bin_section:
                 bin_section['name'] = contest_name + "_" + self.__taskname
                 bin_section['path'] = contest_name + "/" + self.__taskname + ".rs"
-                
+        
+        # 中身が同じなら書き換えない (cargo の fingerprint を無駄に崩さない)
+        text = toml.dumps(data)
+        with open(cargopath, "r") as f:
+            if f.read() == text:
+                return
         with open(cargopath, "w") as f:
-            toml.dump(data, f)
+            f.write(text)
+    
+    def __build_rust(self):
+        # ソースと依存とツールチェインのハッシュが一致すればキャッシュ済みのバイナリを使う
+        import subprocess
+        from src import build_cache
+        name = f"{self.__contest_name}_{self.__taskname}"
+        key = build_cache.solution_key(self.source_path, Path(CONTEST_SOURCECODEDIR) / "Cargo.toml")
+        binary = build_cache.lookup(name, key)
+        if binary is None:
+            self.__change_cargoyaml()
+            command = f"docker compose exec rust cargo build --manifest-path {CONTEST_SOURCECODEDIR}/Cargo.toml --release --bin {name}"
+            if subprocess.call(command, shell=True) != 0:
+                return None
+            binary = build_cache.store(name, key, Path(CONTEST_SOURCECODEDIR) / "target" / "release" / name)
+        return str(binary)
     
     def open_task(self, *args):
+        import subprocess
         url = f"https://atcoder.jp/contests/{self.__contest_name}/tasks/{self.__contest_name}_{self.__taskname}"
+        import webbrowser
         webbrowser.open(url)
         if not self.source_path.exists():
             self.source_path.parent.mkdir(parents=True, exist_ok=True)
@@ -116,22 +197,15 @@ class Contest:
         if self.__interpreter == "rust":
             self.__change_cargoyaml()
                 
-        if not (self.contest_resource_path / "test").exists():
-            self.contest_resource_path.mkdir(parents=True, exist_ok=True)
-            subprocess.call(f"cd {self.contest_resource_path}\noj download {url}", shell=True)
+        # サンプルと AHC のツールは prefetch と同じキャッシュから取る (prefetch 済みならすぐ終わる)
+        if not (self.contest_resource_path / "test").exists() or ("ahc" in self.__contest_name and not (self.contest_resource_path / "tools").exists()):
+            from src import prefetch
+            prefetch.main(self.__contest_name, [self.__taskname], Path(CONTEST_RESOURCE) / self.__contest_name, base_url=self.setting("base_url", prefetch.BASE_URL))
             
         if "ahc" in self.__contest_name:
             # gitinit
             if not (self.source_path.parent / ".git").exists():
                 subprocess.call(f"cd {self.source_path.parent}\ngit init\ngit branch -m main\ngit add *", shell=True)
-            if not (self.contest_resource_path / "tools").exists():
-                tools, webvis = ahc_download_tools.main(url)
-                if tools:
-                    toolsdir = Path(CONTEST_RESOURCE) / self.__contest_name / self.__taskname / "tools"
-                    subprocess.call(f"mv {tools} {toolsdir}", shell=True)
-                if webvis:
-                    webvisdir = Path(CONTEST_RESOURCE) / self.__contest_name / self.__taskname / "webvis"
-                    subprocess.call(f"mv {webvis} {webvisdir}", shell=True)
         
     def test(self):
         if not self.contest_resource_path.exists():
@@ -144,33 +218,197 @@ class Contest:
         if not Path(".temp").exists():
             Path(".temp").mkdir(exist_ok=True)
             
-        if self.__interpreter == "python":
-            import shutil
-            path = Path(CONTEST_SOURCECODEDIR) / self.__contest_name / (self.__taskname + ".py")
-            path = shutil.copy(path, ".temp/run")
-            isok = 0
-            runcommand = f"python {path}"
-        if self.__interpreter == "pypy":
-            import shutil
-            path = Path(CONTEST_SOURCECODEDIR) / self.__contest_name / (self.__taskname + ".py")
-            path = shutil.copy(path, ".temp/run")
-            isok = 0
-            runcommand = f"pypy3 {path}"
+        runcommand = self.__runcommand(".temp/run")
+        # <task>_judge.py があればインタラクティブ、コンテナ内で broker がジャッジと解答をつなぐ
+        judge = Path(CONTEST_SOURCECODEDIR) / self.__contest_name / f"{self.__taskname}_judge.py"
+        if judge.exists():
+            from src import exec_server
+            python = exec_server.SERVICE_PYTHON[self.__interpreter]
+            runcommand = f"{python} src/interactive.py broker {python} {judge} -- {runcommand}"
+        
+        import asyncio
+        from src import ahc_analyze
+        from src import ahc_runner
+        from src import sample_runner
+        samples = sample_runner.discover(self.contest_resource_path / "test")
+        if not samples:
+            print("testcase not found")
+            return False
+        
+        async def run():
+            execute = await self.executor(runcommand)
+            return await sample_runner.run(
+                samples, execute,
+                self.setting("parallel", ahc_runner.default_parallel(self.__interpreter)),
+                self.setting("timeout", TIMEOUT),
+                abs_tol=self.setting("abs_tol", 0.0),
+                rel_tol=self.setting("rel_tol", 0.0),
+                first_failure=self.setting("first_failure", False),
+                first=self.__last_failed,
+                interactive=judge.exists(),
+            )
+        
+        verdicts = asyncio.run(run())
+        # watch で同じインスタンスを使い回すとき、前回落ちたサンプルから流す
+        self.__last_failed = sample_runner.first_failed(samples, verdicts)
+        isok = sample_runner.report(samples, verdicts)
+        outputs = {name: output for name, (_, _, output) in verdicts.items()}
+        for line in ahc_analyze.limit_warnings(outputs, self.setting("time_limit", 2.0), self.setting("memory_limit", 1024.0), self.setting("warn_ratio", 0.8)):
+            print(line)
+
+        return isok
+    
+    def make_samples(self, n):
+        # <task>_gen.py と <task>_naive.py で解答を n ケース試し、食い違ったら縮めて test/ に足す
+        gen = Path(CONTEST_SOURCECODEDIR) / self.__contest_name / f"{self.__taskname}_gen.py"
+        naive = Path(CONTEST_SOURCECODEDIR) / self.__contest_name / f"{self.__taskname}_naive.py"
+        for path in [gen, naive, self.source_path]:
+            if not path.exists():
+                print(f"{path} not found")
+                return False
         if self.__interpreter == "rust":
-            self.__change_cargoyaml()
-            command = f"docker compose exec rust cargo build --manifest-path {CONTEST_SOURCECODEDIR}/Cargo.toml --release --bin {self.__contest_name}_{self.__taskname}"
-            isok = subprocess.call(command, shell=True)
-            runcommand = f'{CONTEST_SOURCECODEDIR}/target/release/{self.__contest_name}_{self.__taskname}'
-
-        if isok != 0:
+            solution = ("exec", self.__runcommand(None).split())
+        else:
+            solution = ("python", str(self.source_path))
+        
+        from src import ahc_runner
+        from src import stress
+        return stress.main(
+            gen, naive, solution, self.contest_resource_path / "test", n,
+            self.setting("parallel", ahc_runner.default_parallel()),
+            timeout=self.setting("timeout", TIMEOUT),
+            abs_tol=self.setting("abs_tol", 0.0),
+            rel_tol=self.setting("rel_tol", 0.0),
+        )
+    
+    async def bench_executor(self):
+        # bench 用にビルドして execute を返す、ソースが無いかビルドに失敗したら None
+        if not self.source_path.exists():
+            return None
+        import asyncio
+        try:
+            runcommand = await asyncio.to_thread(self.__runcommand, f".temp/bench_{self.__interpreter}")
+        except Exception as e:
+            print(f"{self.__interpreter}: {e}")
+            return None
+        return await self.executor(runcommand)
+    
+    async def executor(self, runcommand):
+        # execute(stdin, stdout, stderr, usage, timeout) を返す
+        # --backend=server なら常駐サーバ、それ以外は docker compose exec で実行し、どちらもコンテナ内で usage を測る
+        from src import ahc_runner
+        from src import exec_server
+        if self.setting("backend", "exec") == "server":
+            await exec_server.ensure(self.__interpreter)
+            
+            def execute(stdin, stdout, stderr, usage, timeout, env=None):
+                return exec_server.run(self.__interpreter, runcommand.split(), stdin=stdin, stdout=stdout, stderr=stderr, timeout=timeout, usage=usage, env=env)
+            return execute
+        
+        def execute(stdin, stdout, stderr, usage, timeout, env=None):
+            command = ["docker", "compose", "exec", "-T"]
+            command += [f"--env={k}={v}" for k, v in (env or {}).items()]
+            command += [self.__interpreter, exec_server.SERVICE_PYTHON[self.__interpreter], "src/measure.py", usage, "--"]
+            if timeout:
+                # docker のクライアントを殺してもコンテナ内のプロセスは残るので、中でも timeout をかける
+                command += ["timeout", f"{timeout}s"]
+            command += runcommand.split()
+            return ahc_runner.run(command, stdin=stdin, stdout=stdout, stderr=stderr, timeout=timeout + 5 if timeout else None)
+        return execute
+    
+    def __runcommand(self, copyto):
+        # 実行するコマンド (python は copyto にコピーしたものを動かす、rust はビルドする)
+        if self.__interpreter in ("python", "pypy"):
+            import shutil
+            path = shutil.copy(self.source_path, copyto)
+            return f"{'python' if self.__interpreter == 'python' else 'pypy3'} {path}"
+        runcommand = self.__build_rust()
+        if runcommand is None:
             raise Exception("build error")
+        return runcommand
+    
+    async def __generate(self, toolsexe, n):
+        # tools/in の 0..n-1 を揃える、gen が無ければ入力がすでに全部あるときだけそのまま使う
+        from src import ahc_gen
+        toolsdir = Path(self.contest_resource_path) / "tools"
+        if "gen" in toolsexe:
+            await ahc_gen.generate(toolsdir, toolsexe["gen"], n)
+            return True
+        missing = [i for i in range(n) if not (toolsdir / "in" / (str(i).zfill(4) + ".txt")).exists()]
+        if missing:
+            print(f"gen not found ({toolsdir / 'src' / 'bin' / 'gen.rs'}), and {len(missing)} of {n} inputs are missing in {toolsdir / 'in'}")
+            return False
+        ahc_gen.write_seeds(toolsdir, list(range(n)))
+        return True
+    
+    async def __seed_runner(self, toolsexe, runcommand):
+        # test(seed, outdir, env), vis(seed, outdir) を返す、outdir の下の out/other/usage に書く
+        # CPU 時間・実時間・最大メモリはコンテナ内で測って usage/ に書く
+        from src import ahc_runner
+        from src import ahc_vis
+        from src import exec_server
+        intxt = Path(self.contest_resource_path) / "tools" / "in"
+        testerexe = toolsexe.get("tester", Path(self.contest_resource_path) / "tools" / "target" / "release" / "tester")
+        visexe = toolsexe.get("vis", Path(self.contest_resource_path) / "tools" / "target" / "release" / "vis")
         
-        command = f'cd {self.contest_resource_path}\noj test -j {PALLALEL} -c "docker compose exec {self.__interpreter} {TIMEOUT} {runcommand}"'
-        isok = subprocess.call(command, shell=True)
-
-        return isok == 0
+        # tester がある (インタラクティブ) 場合は、ホストの tester の子として src/interactive.py relay を動かし、
+        # relay が docker compose exec の解答との間を 64KB ずつ中継する (queries や待ち時間は other/ に足す)
+        # interactive = "container" なら tester もコンテナ内で動かし、シードごとの docker compose exec も無くす
+        # (tester はホストでビルドするので、コンテナで動くときだけ)
+        interactive = testerexe.exists() and self.setting("interactive", "host") == "container"
+        if interactive:
+            python = exec_server.SERVICE_PYTHON[self.__interpreter]
+            execute = await self.executor(f"{testerexe} {python} src/interactive.py relay -- {runcommand}")
+        elif not testerexe.exists():
+            execute = await self.executor(runcommand)
+        
+        def test(seed, outdir, env=None):
+            outdir = Path(outdir)
+            if interactive or not testerexe.exists():
+                return execute(intxt / seed, outdir / "out" / seed, outdir / "other" / seed, outdir / "usage" / seed, None, env=env)
+            measure = [exec_server.SERVICE_PYTHON[self.__interpreter], "src/measure.py", outdir / "usage" / seed, "--"]
+            command = [str(testerexe), sys.executable, "src/interactive.py", "relay", "--", "docker", "compose", "exec", "-T"]
+            command += [f"--env={k}={v}" for k, v in (env or {}).items()]
+            command += [self.__interpreter] + measure + runcommand.split()
+            # tester が子の標準エラーを流さなくても統計が残るよう、relay には other/ のパスを渡して追記させる
+            stats = {**os.environ, "INTERACTIVE_STATS": str(outdir / "other" / seed)}
+            return ahc_runner.run(command, stdin=intxt / seed, stdout=outdir / "out" / seed, stderr=outdir / "other" / seed, env=stats)
+        
+        async def vis(seed, outdir):
+            outdir = Path(outdir)
+            if visexe.exists():
+                await ahc_vis.score(visexe, intxt / seed, outdir / "out" / seed, outdir / "other" / seed)
+        
+        return test, vis
     
-    async def ahctest(self, n):
+    async def __profile(self, toolsexe, runcommand, outputs, k):
+        # 実行時間の長い k シードを src/profiler.py の下で流し直し、(collapsed stack の合計, シード) を返す
+        if self.__interpreter not in ("python", "pypy"):
+            print("profile is only for python / pypy")
+            return None
+        import shutil
+        from collections import Counter
+        from src import ahc_analyze
+        from src import ahc_runner
+        from src import profiler
+        slowest = sorted(outputs, key=lambda p: -outputs[p].get("run_time", outputs[p].get("wall", 0.0)))[:k]
+        profdir = Path(self.contest_resource_path) / "tools" / "profile"
+        shutil.rmtree(profdir, ignore_errors=True)
+        for name in ahc_analyze.NAMES + ["folded"]:
+            (profdir / name).mkdir(parents=True)
+        interpreter, script = runcommand.split()
+        test, _ = await self.__seed_runner(toolsexe, f"{interpreter} src/profiler.py -- {script}")
+        jobs = [(seed, lambda seed=seed: test(seed, profdir, env={"PROFILE_OUT": str(profdir / "folded" / seed)})) for seed in slowest]
+        await ahc_runner.run_all(jobs, self.setting("parallel", ahc_runner.default_parallel(self.__interpreter)), "profile")
+        counts = Counter()
+        for seed in slowest:
+            if (profdir / "folded" / seed).exists():
+                profiler.load(profdir / "folded" / seed, counts)
+        shutil.rmtree(profdir, ignore_errors=True)
+        return counts, slowest
+    
+    async def ahctest(self, n, archive=True):
+        # archive=False なら result に残さず集計を表示するだけ (watch のスモークテスト)
         if not (self.contest_resource_path / "tools").exists():
             print("tools not found")
             return
@@ -178,89 +416,109 @@ class Contest:
             print("source code not found")
             return
         
-        seeds_path = Path(self.contest_resource_path) / "tools" / "seeds.txt"
-        if seeds_path.exists():
-            with open(seeds_path) as f:
-                seeds = f.read().split("\n")
-        else:
-            seeds = [""]
-                
-        if seeds[-1] != str(n - 1):
-            with open(self.contest_resource_path / "tools" / "seeds.txt", "w") as f:
-                f.write("\n".join([str(i) for i in range(n)]))
-            command = f"cargo run --manifest-path {self.contest_resource_path}/tools/Cargo.toml --bin gen {self.contest_resource_path}/tools/seeds.txt"
-            subprocess.call(command, shell=True)
+        from src import build_cache
+        toolsexe = build_cache.build_tools(Path(self.contest_resource_path) / "tools", ["gen", "tester", "vis"])
+        
+        # --compare=best|latest|<date> : 過去の結果と同じシードをランダムな順に流し、差がはっきりしたら打ち切る
+        sequential = None
+        if OPTIONS.get("compare"):
+            from src import ahc_sequential
+            resultpath = self.contest_resource_path / "result"
+            date = ahc_sequential.reference_date(resultpath, OPTIONS["compare"], minimize=self.setting("minimize", False))
+            reference = ahc_sequential.load_reference(resultpath / date) if date else {}
+            if not reference:
+                print("reference result not found")
+                return
+            print(f"compare with {date} ({len(reference)} seeds)")
+            sequential = ahc_sequential.SequentialTest(reference, minimize=self.setting("minimize", False))
+            n = max(int(p[:-4]) for p in reference) + 1
+        
+        # 無い・古い入力だけを生成する
+        if not await self.__generate(toolsexe, n):
+            return
         
         seeds = [str(i).zfill(4) + ".txt" for i in range(n)]
+        if sequential is not None:
+            import random
+            seeds = [seed for seed in seeds if seed in sequential.reference]
+            random.shuffle(seeds)
         
         intxt = (Path(self.contest_resource_path) / "tools" / "in")
         outtxt = (Path(self.contest_resource_path) / "tools" / "out")
         othertxt = (Path(self.contest_resource_path) / "tools" / "other")
-        for txt in [intxt, outtxt, othertxt]:
+        usagetxt = (Path(self.contest_resource_path) / "tools" / "usage")
+        for txt in [intxt, outtxt, othertxt, usagetxt]:
             txt.mkdir(parents=True, exist_ok=True)
         for seed in seeds:
             open(othertxt / seed, "w").close()
         
         (Path(self.contest_resource_path) / "tools" / "out").mkdir(parents=True, exist_ok=True)
-        
-        if (Path(self.contest_resource_path) / "tools" / "src" / "bin" / "tester.rs").exists():
-            command = f"cargo build --manifest-path {self.contest_resource_path}/tools/Cargo.toml --release --bin tester"
-            subprocess.call(command, shell=True)
 
-        if self.__interpreter == "python":
-            import shutil
-            path = Path(CONTEST_SOURCECODEDIR) / self.__contest_name / (self.__taskname + ".py")
-            path = shutil.copy(path, "temp")
-            isok = 0
-            runcommand = f"python {path}"
-        if self.__interpreter == "pypy":
-            import shutil
-            path = Path(CONTEST_SOURCECODEDIR) / self.__contest_name / (self.__taskname + ".py")
-            path = shutil.copy(path, "temp")
-            isok = 0
-            runcommand = f"pypy3 {path}"
-        if self.__interpreter == "rust":
-            self.__change_cargoyaml()
-            command = f"docker compose exec rust cargo build --manifest-path {CONTEST_SOURCECODEDIR}/Cargo.toml --release --bin {self.__contest_name}_{self.__taskname}"
-            isok = subprocess.call(command, shell=True)
-            runcommand = f'{CONTEST_SOURCECODEDIR}/target/release/{self.__contest_name}_{self.__taskname}'
-
-        if isok != 0:
-            raise Exception("build error")
+        runcommand = self.__runcommand("temp")
         
-        async def test(seed):
-            command = f"docker compose exec {self.__interpreter} {runcommand}"
-            testerexe = Path(self.contest_resource_path) / "tools" / "target" / "release" / "tester"
-            if testerexe.exists():
-                command = str(testerexe) + " " + command
-            command = command + f' < {intxt / seed} 1> {outtxt / seed} 2>> {othertxt / seed}'
-            subprocess.call(command, shell=True)
-            
-        tasks = [test(seed) for seed in seeds]
-        await asyncio.gather(*tasks)
-        
-        visexe = Path(self.contest_resource_path) / "tools" / "target" / "release" / "vis"
-        if not visexe.exists():
-            command = f"cargo build --manifest-path {self.contest_resource_path}/tools/Cargo.toml --release --bin vis"
-            subprocess.call(command, shell=True)
-
-        async def vis(seed):
-            command = f"./{visexe} {intxt / seed} {outtxt / seed} 1>> {othertxt / seed} 2>> {othertxt / seed}"
-            subprocess.call(command, shell=True)  
-            
-        tasks = [vis(seed) for seed in seeds]
-        await asyncio.gather(*tasks)  
+        import asyncio
+        from src import ahc_analyze
+        from src import ahc_runner
+        parallel = self.setting("parallel", ahc_runner.default_parallel(self.__interpreter))
+        toolsdir = Path(self.contest_resource_path) / "tools"
+        test, vis = await self.__seed_runner(toolsexe, runcommand)
+
+        # シードが終わるたびに vis と解析を流す、vis はホストで動くのでコア数まで並列
+        vissemaphore = asyncio.Semaphore(self.setting("parallel", ahc_runner.default_parallel()))
+        live = ahc_analyze.Live(len(seeds), minimize=self.setting("minimize", False))
+
+        async def done(seed, ret, wall):
+            with open(othertxt / seed, "a") as f:
+                f.write(f"\nwall = {wall:.3f}\n")
+            async with vissemaphore:
+                await vis(seed, toolsdir)
+            output = await asyncio.to_thread(ahc_analyze.parse_seed, (str(self.contest_resource_path), seed))
+            live.add(seed, output)
+            if sequential is not None and sequential.add(seed, output):
+                return True
+
+        # --workers=N / --listen=host:port : シードをワーカに分けて流す、vis と解析はここで行う
+        coordinator = None
+        if self.setting("workers", 0) or self.setting("listen", ""):
+            from src import ahc_worker
+            argv = runcommand.split()
+            if toolsexe.get("tester") is not None and toolsexe["tester"].exists():
+                argv = [str(toolsexe["tester"])] + argv
+            coordinator = ahc_worker.Coordinator(
+                argv, intxt, seeds, self.setting("listen", "") or "127.0.0.1:0", self.setting("workers", 0),
+                timeout=self.setting("timeout", TIMEOUT),
+            )
+            coordinator.start(asyncio.get_running_loop())
+            test = coordinator.test
+            # 全部キューに積んでおき、ワーカが空きの分だけ取っていく
+            parallel = len(seeds)
+        try:
+            results = await ahc_runner.run_all([(seed, lambda seed=seed: test(seed, toolsdir)) for seed in seeds], parallel, None, on_done=done)
+        finally:
+            if coordinator is not None:
+                coordinator.close()
+        ahc_runner.report("test", results)
+        for line in ahc_analyze.limit_warnings(live.outputs, self.setting("time_limit", 2.0), self.setting("memory_limit", 1024.0), self.setting("warn_ratio", 0.8)):
+            print(line)
+        if sequential is not None:
+            print(f"compare: {sequential.summary()}")
         
-        vishtml = Path("vis.html")
-        if vishtml.exists():
-            vishtml.unlink()
-            
         if not Path(self.contest_resource_path).exists():
             Path(self.contest_resource_path).mkdir(parents=True, exist_ok=True)
         
+        # --profile[=k] : 実行時間の長い k シード (既定 5) をプロファイラの下で流し直して result に残す
+        profile = None
+        if OPTIONS.get("profile") and archive:
+            profile = await self.__profile(toolsexe, runcommand, live.outputs, 5 if OPTIONS["profile"] is True else int(OPTIONS["profile"]))
+        
         print("Test Done!!")
+        if not archive:
+            print(live.aggregator.to_string())
+            return
 
-        result_path = ahc_analyze.main(str(self.source_path), str(self.contest_resource_path))
+        # --compare で途中で止めた run は打ち切りとして残し、best などの選択には使わない
+        partial = (len(live.outputs), len(seeds)) if sequential is not None and len(live.outputs) < len(seeds) else None
+        result_path = ahc_analyze.main(str(self.source_path), str(self.contest_resource_path), table=bool(OPTIONS.get("table")), outputs=live.outputs, paths=sorted(live.outputs) if sequential is not None else None, profile=profile, partial=partial)
         resultpath = Path(result_path)
         if not resultpath.exists():
             return
@@ -271,14 +529,121 @@ class Contest:
             with open(webvis, "r") as f:
                 webvisurl = f.read().split("\n")[0]
 
-            with open(Path(result_path) / "out" / "0000.txt", "r") as f:
-                import urllib
-                webvisurl = webvisurl + "&output=" + urllib.parse.quote(f.read())
+            from src import ahc_objects
+            reader = ahc_objects.Reader(result_path)
+            output = reader.read("out", "0000.txt")
+            reader.close()
+            if output is not None:
+                import urllib.parse
+                webvisurl = webvisurl + "&output=" + urllib.parse.quote(output.decode())
             
+            import webbrowser
             webbrowser.open(webvisurl)
         
         
+    async def ahctune(self, n):
+        # config.toml の [tune] を successive halving で探索する、入力と実行コマンドは ahctest と同じ
+        from src import ahc_tune
+        space = ahc_tune.parse_space(self.config.get("tune", {}))
+        if not space:
+            print("[tune] not found in config.toml")
+            return
+        if not (self.contest_resource_path / "tools").exists():
+            print("tools not found")
+            return
+        if not self.source_path.exists():
+            print("source code not found")
+            return
+        
+        from src import build_cache
+        toolsdir = Path(self.contest_resource_path) / "tools"
+        toolsexe = build_cache.build_tools(toolsdir, ["gen", "tester", "vis"])
+        if not await self.__generate(toolsexe, n):
+            return
+        seeds = [str(i).zfill(4) + ".txt" for i in range(n)]
+        
+        runcommand = self.__runcommand("temp")
+        test, vis = await self.__seed_runner(toolsexe, runcommand)
+        
+        import asyncio
+        import shutil
+        from src import ahc_analyze
+        from src import ahc_runner
+        tunedir = toolsdir / "tune"
+        shutil.rmtree(tunedir, ignore_errors=True)
+        vissemaphore = asyncio.Semaphore(self.setting("parallel", ahc_runner.default_parallel()))
+        
+        def run(trial, params, seed):
+            outdir = tunedir / str(trial)
+            for name in ahc_analyze.NAMES:
+                (outdir / name).mkdir(parents=True, exist_ok=True)
+            open(outdir / "other" / seed, "w").close()
+            return test(seed, outdir, env=ahc_tune.environ(params))
+        
+        async def finish(trial, seed):
+            outdir = tunedir / str(trial)
+            async with vissemaphore:
+                await vis(seed, outdir)
+            return await asyncio.to_thread(ahc_analyze.parse_outputs, outdir, seed)
+        
+        configs, outputs, ranked, reached = await ahc_tune.successive_halving(
+            space, seeds, run, finish,
+            self.setting("parallel", ahc_runner.default_parallel(self.__interpreter)),
+            trials=self.setting("trials", 16),
+            min_seeds=self.setting("min_seeds", 10),
+            minimize=self.setting("minimize", False),
+        )
+        
+        import datetime
+        date = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        tunepath = self.contest_resource_path / "result" / "tune" / date
+        ahc_tune.record(tunepath, configs, outputs, ranked, reached)
+        shutil.copy(self.source_path, tunepath)
+        shutil.rmtree(tunedir, ignore_errors=True)
+        print(f"best: {configs[ranked[0]] or '(default)'} ({tunepath / 'trials.json'})")
+        
+    async def ahcrender(self, tag="latest", seeds=None, worst=5):
+        # 指定したシード (無ければ悪い方から worst 個) の vis の生成物を result/<date>/vis/ に置く
+        from src import ahc_store
+        from src import ahc_vis
+        from src import build_cache
+        toolsdir = Path(self.contest_resource_path) / "tools"
+        visexe = build_cache.build_tools(toolsdir, ["vis"]).get("vis")
+        if visexe is None or not visexe.exists():
+            print("vis not found")
+            return
+        resultpath = self.contest_resource_path / "result"
+        minimize = self.setting("minimize", False)
+        date = ahc_store.select(ahc_store.load_history(resultpath), tag, minimize=minimize)
+        if date is None:
+            print("result not found")
+            return
+        rundir = resultpath / date
+        if not seeds:
+            import numpy as np
+            run = ahc_store.load_run(rundir)
+            score = run.get("Score", np.full(len(run["seed"]), np.nan))
+            bad = -score if minimize else score
+            order = np.argsort(np.where(np.isnan(bad), -np.inf, bad), kind="stable")
+            seeds = [str(run["seed"][i]).zfill(4) + ".txt" for i in order[:worst]]
+        
+        # vis にはパスで渡すので、pack に入っている出力は取り出しておく
+        from src import ahc_objects
+        from src import ahc_runner
+        reader = ahc_objects.Reader(rundir)
+        outputs = {seed: reader.path("out", seed) for seed in seeds}
+        reader.close()
+        jobs = [
+            (seed, lambda seed=seed: ahc_vis.render(visexe, toolsdir / "in" / seed, outputs[seed], rundir / "vis", seed[:-4]))
+            for seed in seeds if outputs[seed] is not None
+        ]
+        results = await ahc_runner.run_all(jobs, self.setting("parallel", ahc_runner.default_parallel()), "render")
+        for seed in seeds:
+            paths = results[seed][0] if seed in results else []
+            print(f"{seed[:-4]}: {' '.join(str(p) for p in paths) if paths else 'vis failed'}")
+        
     def submit(self):
+        import subprocess
         if not self.source_path.exists():
             print("source code not found")
             return
@@ -295,30 +660,30 @@ class Contest:
             subprocess.Popen(command, shell=True, stdout=devnull, stderr=devnull)
 
     def ahcsubmit(self):
+        import subprocess
         if not self.source_path.exists():
             print("source code not found")
             return
         
         resultpath = Path(CONTEST_RESOURCE) / self.__contest_name / self.__taskname / "result"
-        import pandas as pd
-        # [0] = date(str), , [1] = score(float)
-        scores = pd.read_csv(resultpath / "score.txt", header=None, delimiter=" = ", dtype={0: str, 1: float})  
-        
-        choices = {
-            "min": scores[1].min(),
-            "max": scores[1].max(),
-            "latest": scores[1].iloc[-1],
-        }
-        print("choose tag")
+        from src import ahc_index
+        # 初めて使うときや index を作る前の run があれば足しておく
+        if resultpath.exists():
+            ahc_index.sync(resultpath, Path(self.contest_resource_path) / "tools" / "in")
+        minimize = self.setting("minimize", False)
+        budget = self.setting("time_budget", self.setting("time_limit", 2.0))
+        
+        choices = {tag: ahc_index.select(resultpath, tag, minimize=minimize, budget=budget) for tag in ["best", "median", "large", "budget", "latest"]}
+        print(f"choose tag (or date), budget = time_max <= {budget}s")
         for k, v in choices.items():
-            print(f"{k}: {v}")
-        tag = input()
-        if tag not in choices:
+            print(f"{k}: {ahc_index.describe(v)}")
+        tag = input().strip()
+        choice = choices.get(tag) or (ahc_index.select(resultpath, tag) if tag not in choices else None)
+        if choice is None:
             print("invalid tag")
             return
         
-        choice = scores[scores[1] == choices[tag]].iloc[0]
-        choicepath = resultpath / str(choice[0]) / self.source_path.name
+        choicepath = resultpath / choice["date"] / (choice["source"] or self.source_path.name)
         if not choicepath.exists():
             print("source code not found")
             return
@@ -335,23 +700,136 @@ def open_task(*args):
     taskname = args[0]
     Contest(contest_name, interpreter, taskname).open_task()
 
+def prefetch(*args):
+    #[0:] = tasknames (無ければタスク一覧から全部)
+    from src import prefetch as fetcher
+    from src import ahc_runner
+    contest = Contest(contest_name, interpreter, args[0] if args else "")
+    fetcher.main(
+        contest_name, list(args), Path(CONTEST_RESOURCE) / contest_name,
+        base_url=contest.setting("base_url", fetcher.BASE_URL),
+        parallel=contest.setting("parallel", ahc_runner.default_parallel()),
+    )
+
 def make_samples(*args):
     #[0] = taskname
     #[1] = n
     taskname = args[0]
-    raise "not implemented"
+    Contest(contest_name, interpreter, taskname).make_samples(int(args[1]))
 
 def test(*args):
     #[0] = taskname
     #[1] = n
     taskname = args[0]
-    n = args[1] if len(args) > 1 else 10
+    n = int(OPTIONS.get("seeds", args[1] if len(args) > 1 else 10))
     contest = Contest(contest_name, interpreter, taskname)
     if "ahc" in contest_name:
+        import asyncio
         asyncio.run(contest.ahctest(n))
     else:
         contest.test()
 
+
+def render(*args):
+    #[0] = taskname
+    #[1:] = best/latest/min/max/<date> と シード番号 (無ければ latest の悪い方から --worst 個)
+    taskname = args[0]
+    tag = "latest"
+    seeds = []
+    for a in args[1:]:
+        if a.isdigit():
+            seeds.append(a.zfill(4) + ".txt")
+        else:
+            tag = a
+    contest = Contest(contest_name, interpreter, taskname)
+    import asyncio
+    asyncio.run(contest.ahcrender(tag, seeds, contest.setting("worst", 5)))
+
+
+def bench(*args):
+    #[0] = taskname
+    # ソースがある実装 (python / pypy / rust) を全部同じ入力で流して比べる
+    taskname = args[0]
+    import asyncio
+    from src import ahc_runner
+    from src import bench as benchmark
+    from src import sample_runner
+    contests = {name: Contest(contest_name, name, taskname) for name in EXTENSIONS}
+    contest = contests[interpreter]
+    if "ahc" in contest_name:
+        intxt = contest.contest_resource_path / "tools" / "in"
+        seeds = [str(i).zfill(4) + ".txt" for i in range(contest.setting("bench_seeds", 10))]
+        samples = [(seed[:-4], intxt / seed, None) for seed in seeds if (intxt / seed).exists()]
+    else:
+        samples = sample_runner.discover(contest.contest_resource_path / "test")
+    if not samples:
+        print("testcase not found")
+        return
+    Path(".temp").mkdir(exist_ok=True)
+    
+    async def run():
+        # ビルドも並列に (rust のビルド中に python を流し始める)
+        executors = await asyncio.gather(*[c.bench_executor() for c in contests.values()])
+        variants = {name: e for name, e in zip(contests, executors) if e is not None}
+        if not variants:
+            print("source code not found")
+            return None
+        parallel = {name: contest.setting("parallel", ahc_runner.default_parallel(name)) for name in variants}
+        return await benchmark.run(variants, samples, contest.setting("repeat", 5), parallel, contest.setting("timeout", TIMEOUT))
+    
+    results = asyncio.run(run())
+    if results:
+        benchmark.report(
+            results, samples, contest.setting("time_limit", 2.0),
+            check="ahc" not in contest_name,
+            abs_tol=contest.setting("abs_tol", 0.0),
+            rel_tol=contest.setting("rel_tol", 0.0),
+        )
+
+
+def tune(*args):
+    #[0] = taskname
+    taskname = args[0]
+    if "ahc" not in contest_name:
+        print("tune is only for ahc")
+        return
+    contest = Contest(contest_name, interpreter, taskname)
+    import asyncio
+    asyncio.run(contest.ahctune(contest.setting("tune_seeds", 100)))
+
+
+def watch(*args):
+    #[0] = taskname
+    # ソースが保存されるたびにテストを流す、プロセスは起動したままにしておく
+    taskname = args[0]
+    from src import watch as watcher
+    contest = Contest(contest_name, interpreter, taskname)
+    
+    def run():
+        print(f"\n--- {contest.source_path} ---")
+        try:
+            if "ahc" in contest_name:
+                import asyncio
+                asyncio.run(contest.ahctest(contest.setting("smoke_seeds", 10), archive=False))
+            else:
+                contest.test()
+        except Exception as e:
+            print(e)
+    
+    try:
+        watcher.watch(contest.source_path, run)
+    except KeyboardInterrupt:
+        pass
+
+
+def compare(*args):
+    #[0] = taskname
+    #[1:] = result のディレクトリ or date or best/latest/min/max
+    taskname = args[0]
+    from src import ahc_compare
+    contest = Contest(contest_name, interpreter, taskname)
+    ahc_compare.main(contest.contest_resource_path, list(args[1:]), minimize=contest.setting("minimize", False))
+
     
 def submit(*args):
     #[0] = taskname
@@ -378,6 +856,16 @@ COMMANDS = {
     "s": (submit, 1),
     "open": (open_task, 1),
     "o": (open_task, 1),
+    "watch": (watch, 1),
+    "w": (watch, 1),
+    "prefetch": (prefetch, -1),
+    "p": (prefetch, -1),
+    "bench": (bench, 1),
+    "b": (bench, 1),
+    "tune": (tune, 1),
+    "render": (render, -1),
+    "compare": (compare, -1),
+    "c": (compare, -1),
     "make_samples": (make_samples, 2),
     "mk": (make_samples, 2),
     "m": (make_samples, 2),
@@ -387,6 +875,9 @@ i = 0
 while i < len(argv):
     if argv[i] in COMMANDS:
         command, n = COMMANDS[argv[i]]
+        # n < 0 なら残りの引数を全部渡す
+        if n < 0:
+            n = len(argv) - i - 1
         args = []
         for j in range(n):
             if i + j + 1 >= len(argv):
@@ -1,82 +1,394 @@
 import os
-import pandas as pd
+import sys
+import json
+import math
 from pathlib import Path
 
 GROUPS = []
+NAMES = ["out", "other", "usage"]
+QUANTILES = [0.25, 0.5, 0.75]
+# ここまでの件数は値を持っておいて分位点を正確に出す (P² は件数が少ないと外れやすい)
+EXACT = 4096
+WIDTH = 12
 
-def main(source_path, contest_resource_path):
-    source_path = Path(source_path)
-    contest_resource_path = Path(contest_resource_path)
-    outputs = []
-    with open(contest_resource_path / "tools" / "seeds.txt", "r") as f:
-        paths = f.read().split("\n")
-        paths = [p.zfill(4) + ".txt" for p in paths]
-    for path in paths:
-        output = {}
-        for name in ["out", "other"]:
-            with open(contest_resource_path / "tools" / name / path, "r") as f:
-                for l in f.read().split("\n"):
-                    if not " = " in l:
-                        continue
-                    x = l.split(" = ")[0]
-                    y = l.split(" = ")[1].replace("\n", "")
-                    try:
-                        y = float(y)
-                    except:
-                        pass
-                    output[x] = y
-
-        import math
-
-        if "score" in output:
-            output["Score"] = output["score"]
-        if "Score" in output:
-            output["logscore"] = math.log(output["Score"] + 1)
-
-        outputs.append(output)
-
-    outputs = pd.DataFrame(outputs)
+
+def parse_value(y):
+    try:
+        return float(y)
+    except ValueError:
+        return y
+
+
+def parse_lines(lines, output):
+    # " = " を含む行だけを拾う
+    for l in lines:
+        if b" = " not in l:
+            continue
+        x, y = l.decode(errors="replace").split(" = ")[:2]
+        output[x] = parse_value(y.strip())
+
+
+def parse_file(path, output):
+    # 出力全体は読まずに行ごとに見る
+    with open(path, "rb") as f:
+        parse_lines(f, output)
+
+
+def derive(output):
+    if "score" in output:
+        output["Score"] = output["score"]
+    if isinstance(output.get("Score"), float):
+        output["logscore"] = math.log(output["Score"] + 1)
+    return output
+
+
+def parse_seed(args):
+    contest_resource_path, path = args
+    return parse_outputs(Path(contest_resource_path) / "tools", path)
+
+
+def parse_outputs(directory, path):
+    # directory/{out,other,usage}/path をまとめて 1 シード分にする
+    output = {}
+    for name in NAMES:
+        file = Path(directory) / name / path
+        if file.exists():
+            parse_file(file, output)
+    return derive(output)
+
+
+def parse_run(reader, path):
+    # 保存済みの run (ahc_objects.Reader) から 1 シード分を読む
+    output = {}
+    for name in NAMES:
+        data = reader.read(name, path)
+        if data is not None:
+            parse_lines(data.splitlines(), output)
+    return derive(output)
+
+
+def parse_all(contest_resource_path, paths, parallel=None):
+    # シードごとに並列で読む、結果は paths の順に返す
+    parallel = parallel or os.cpu_count() or 1
+    args = [(str(contest_resource_path), p) for p in paths]
+    if parallel <= 1 or len(paths) < 64:
+        yield from map(parse_seed, args)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(parallel) as executor:
+        yield from executor.map(parse_seed, args, chunksize=max(1, len(args) // (parallel * 4)))
+
+
+class Quantile:
+    # P² アルゴリズム (Jain & Chlamtac)、値を持たずに分位点を推定する
+    def __init__(self, p):
+        self.p = p
+        self.q = []
+        self.n = [0, 1, 2, 3, 4]
+        self.np = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self.dn = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        q, n = self.q, self.n
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while not (q[k] <= x < q[k + 1]):
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.np[i] += self.dn[i]
+        for i in range(1, 4):
+            d = self.np[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                qp = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < qp < q[i + 1]:
+                    qp = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = qp
+                n[i] += d
+
+    def value(self):
+        q = self.q
+        if not q:
+            return math.nan
+        if len(q) < 5:
+            return exact_quantile(q, self.p)
+        return q[2]
+
+
+def exact_quantile(values, p):
+    # pandas と同じ線形補間、values は昇順
+    pos = (len(values) - 1) * p
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+class Stat:
+    # 件数・平均・分散 (Welford)・最小・最大・分位点をオンラインで持つ
+    # 分位点は EXACT 件までは値から正確に出し、それを超えたら値を捨てて P² の推定にする
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.quantiles = [Quantile(p) for p in QUANTILES]
+        self.values = []
+
+    def add(self, x):
+        if math.isnan(x):
+            return
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+        for q in self.quantiles:
+            q.add(x)
+        if self.values is not None:
+            self.values.append(x)
+            if len(self.values) > EXACT:
+                self.values = None
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else math.nan
+
+    def describe(self):
+        if self.values:
+            values = sorted(self.values)
+            quantiles = [exact_quantile(values, p) for p in QUANTILES]
+        else:
+            quantiles = [q.value() for q in self.quantiles]
+        return [self.count, self.mean, self.std, self.min] + quantiles + [self.max]
+
+
+class Aggregator:
+    def __init__(self):
+        self.stats = {}
+
+    def add(self, output):
+        for k, v in output.items():
+            if isinstance(v, float):
+                if k not in self.stats:
+                    self.stats[k] = Stat()
+                self.stats[k].add(v)
+
+    def mean(self, key):
+        stat = self.stats.get(key)
+        return stat.mean if stat is not None and stat.count else math.nan
+
+    def to_string(self, drop=None):
+        keys = [k for k in self.stats if k != drop]
+        labels = ["count", "mean", "std", "min"] + [f"{int(p * 100)}%" for p in QUANTILES] + ["max"]
+        lines = [" " * 6 + "".join(k.rjust(WIDTH) for k in keys)]
+        columns = [self.stats[k].describe() for k in keys]
+        for i, label in enumerate(labels):
+            lines.append(label.ljust(6) + "".join(format_value(c[i]).rjust(WIDTH) for c in columns))
+        return "\n".join(lines)
+
+
+class Live:
+    # シードが終わるたびに足していき、平均スコアと悪いシードを表示する
+    def __init__(self, total, minimize=False, k=5):
+        self.total = total
+        self.minimize = minimize
+        self.k = k
+        self.aggregator = Aggregator()
+        self.outputs = {}
+        self.worst = []
+
+    def add(self, path, output):
+        self.outputs[path] = output
+        self.aggregator.add(output)
+        score = output.get("Score")
+        if isinstance(score, float):
+            # 悪い順に k 個だけ持つ
+            self.worst.append((-score if self.minimize else score, path))
+            self.worst.sort()
+            del self.worst[self.k:]
+        self.show()
+
+    def show(self):
+        worst = " ".join(f"{p[:-4]}({abs(s):.0f})" for s, p in self.worst)
+        sys.stderr.write(f"\r[score] {len(self.outputs)}/{self.total} mean = {self.aggregator.mean('Score'):.2f} worst: {worst}\033[K")
+        sys.stderr.flush()
+
+
+def limit_warnings(outputs, time_limit, memory_limit, ratio):
+    # 実行時間・メモリが制限の ratio 倍を超えたシード
+    lines = []
+    for path in sorted(outputs):
+        output = outputs[path]
+        for key, limit, unit in [("run_time", time_limit, "s"), ("cpu_time", time_limit, "s"), ("maxrss_mb", memory_limit, "MB")]:
+            value = output.get(key)
+            if isinstance(value, float) and value > limit * ratio:
+                lines.append(f"warning: {path} {key} = {value:.3f}{unit} ({value / limit * 100:.0f}% of {limit}{unit})")
+    return lines
+
+
+def format_value(v):
+    if isinstance(v, float):
+        return f"{v:.2f}"
+    return str(v)
+
+
+def write_table(f, rowspath, paths, columns):
+    # シードごとの表は一時ファイルから 1 行ずつ書き出す
+    width = max([len(p) for p in paths] + [0])
+    f.write(" " * width + "".join(c.rjust(WIDTH) for c in columns) + "\n")
+    with open(rowspath, "r") as rows:
+        for path, line in zip(paths, rows):
+            row = json.loads(line)
+            f.write(path.ljust(width) + "".join(format_value(row.get(c, math.nan)).rjust(WIDTH) for c in columns) + "\n")
+
+
+def write_pandas(f, rowspath, paths):
+    import pandas as pd
+    with open(rowspath, "r") as rows:
+        outputs = pd.DataFrame([json.loads(line) for line in rows])
     outputs.index = paths
 
     pd.options.display.float_format = '{:.2f}'.format
 
+    f.write("\n\n")
+    f.write("all data\n")
+    f.write(outputs.describe().to_string())
+    f.write("\n\n\n")
+
+    def group(name):
+        outputss = outputs.groupby(name)
+        for d, outputs_ in outputss:
+            f.write(name + " = " + str(d) + "\n")
+            f.write(outputs_.drop(columns=name).describe().to_string())
+            f.write("\n\n\n")
+
+    [group(g) for g in GROUPS]
+
+    f.write(outputs.to_string())
+
+
+def write_profile(f, counts, seeds, k=20):
+    from src import profiler
+    f.write(f"hot spots (profile of {len(seeds)} seeds: {' '.join(p[:-4] for p in seeds)}, {sum(counts.values())} samples)\n")
+    for ratio, leaf in profiler.hot_spots(counts, k):
+        f.write(f"{ratio * 100:6.1f}%  {leaf}\n")
+    f.write("\n\n")
+
+
+def main(source_path, contest_resource_path, table=False, outputs=None, paths=None, profile=None, partial=None):
+    # outputs = {path: 解析済みの値}、渡されたシードは読み直さない
+    # paths を渡すとそのシードだけを集計する (途中で打ち切ったとき)
+    # profile = (collapsed stack の Counter, シード) を渡すと profile.folded とホットスポットも残す
+    # partial = (流したシード数, 全シード数) を渡すと途中で打ち切った run として残す (best などの選択には使わない)
+    source_path = Path(source_path)
+    contest_resource_path = Path(contest_resource_path)
+    if paths is None:
+        with open(contest_resource_path / "tools" / "seeds.txt", "r") as f:
+            paths = f.read().split("\n")
+            paths = [p.zfill(4) + ".txt" for p in paths]
+
     resultpath = contest_resource_path / "result"
-    
+    if not resultpath.exists():
+        resultpath.mkdir(exist_ok=True, parents=True)
+
+    # 今回の run を足す前の履歴 (無ければ過去の結果から作る)
+    from src import ahc_store
+    history = ahc_store.load_history(resultpath)
+
+    # 集計はオンラインで行い、シードごとの行は一時ファイルに流す
+    aggregator = Aggregator()
+    groups = {}
+    columns = {}
+    rowspath = resultpath / ".rows.jsonl"
+    with open(rowspath, "w") as rows:
+        outputs = outputs or {}
+        rest = parse_all(contest_resource_path, [p for p in paths if p not in outputs])
+        for path in paths:
+            output = outputs[path] if path in outputs else next(rest)
+            aggregator.add(output)
+            for g in GROUPS:
+                if g in output:
+                    groups.setdefault((g, output[g]), Aggregator()).add(output)
+            for k in output:
+                columns[k] = None
+            rows.write(json.dumps(output) + "\n")
 
     import datetime
     date = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-    if not (resultpath / "score.txt").exists():
-        resultpath.mkdir(exist_ok=True, parents=True)
     with open(resultpath / "score.txt", "a") as f:
-        f.write(date + " = " + str(outputs["Score"].mean()))
+        f.write(date + " = " + str(aggregator.mean("Score")))
+        if partial is not None:
+            f.write(f"  # partial {partial[0]}/{partial[1]}")
         f.write("\n")
-    
+
     resultpath = resultpath / date
     if not resultpath.exists():
         resultpath.mkdir(exist_ok=True, parents=True)
-        
-    with open(resultpath / "summary.txt", "w") as f:        
-        f.write("\n\n")
-        f.write("all data\n")
-        f.write(outputs.describe().to_string())
-        f.write("\n\n\n")
-
-        def group(name):
-            outputss = outputs.groupby(name)
-            for d, outputs_ in outputss:
+    if partial is not None:
+        (resultpath / ahc_store.PARTIAL).write_text(f"{partial[0]}/{partial[1]}\n")
+
+    if profile is not None:
+        with open(resultpath / "profile.folded", "w") as f:
+            for stack, count in profile[0].most_common():
+                f.write(f"{stack} {count}\n")
+
+    with open(resultpath / "summary.txt", "w") as f:
+        if profile is not None:
+            f.write("\n\n")
+            write_profile(f, *profile)
+        if table:
+            write_pandas(f, rowspath, paths)
+        else:
+            f.write("\n\n")
+            f.write("all data\n")
+            f.write(aggregator.to_string())
+            f.write("\n\n\n")
+
+            for (name, d), group in groups.items():
                 f.write(name + " = " + str(d) + "\n")
-                f.write(outputs_.drop(columns=name).describe().to_string())
+                f.write(group.to_string(drop=name))
                 f.write("\n\n\n")
 
-        [group(g) for g in GROUPS]
+            write_table(f, rowspath, paths, list(columns))
+
+    # シードごとの指標を列で保存して履歴に足す
+    with open(rowspath, "r") as rows:
+        ahc_store.write_run(resultpath, [(path, json.loads(line)) for path, line in zip(paths, rows)])
+    run = ahc_store.load_run(resultpath)
+    ahc_store.append_history(resultpath.parent, date, run, history, partial=partial is not None)
+    rowspath.unlink()
 
-        f.write(outputs.to_string())
-        
-    import shutil        
-    shutil.move(contest_resource_path.absolute() / "tools" / "out", resultpath)
-    shutil.move(contest_resource_path.absolute() / "tools" / "other", resultpath)
+    # ahcsubmit で選ぶための要約を result/index.sqlite に足す
+    from src import ahc_index
+    sizes = ahc_index.sizes_of(run, contest_resource_path / "tools" / "in")
+    ahc_index.record(resultpath.parent, date, run, source_path, sizes, ahc_index.git_commit(source_path), partial=partial is not None)
+
+    # out/other/usage は中身のハッシュで重複を除いて result/objects にまとめる
+    import shutil
+    from src import ahc_objects
+    toolspath = contest_resource_path / "tools"
+    ahc_objects.archive(resultpath.parent, date, {name: toolspath / name for name in NAMES})
+    for name in NAMES:
+        shutil.rmtree(toolspath / name, ignore_errors=True)
     shutil.copy(source_path.absolute(), resultpath.absolute())
-        
+
     print("Analyze Done!!")
 
-    return str(resultpath)
\ No newline at end of file
+    return str(resultpath)
@@ -0,0 +1,115 @@
+from pathlib import Path
+
+from src import ahc_store
+
+# スコア自体やスコアから作る列はパラメータとして扱わない
+SCORES = ["Score", "score", "logscore", "wall", "run_time", "cpu_time", "user_time", "sys_time", "maxrss_mb"]
+QUANTILES = [0.0, 0.05, 0.25, 0.5, 0.75, 0.95, 1.0]
+BINS = 4
+
+
+def resolve(resultpath, ref, history, minimize=False):
+    # result ディレクトリのパス、date、best/latest/min/max のどれでも受ける
+    if Path(ref).is_dir() and ((Path(ref) / "other").exists() or (Path(ref) / ahc_store.METRICS).exists()):
+        return Path(ref)
+    date = ahc_store.select(history, ref, minimize)
+    if date is None or not (Path(resultpath) / date).exists():
+        return None
+    return Path(resultpath) / date
+
+
+def align(base, new):
+    import numpy as np
+    seeds, i, j = np.intersect1d(base["seed"], new["seed"], return_indices=True)
+    return seeds, i, j
+
+
+def params(base, new, i, j):
+    # 入力から決まる値 (N, M など) は両方の run で同じになるはず
+    import numpy as np
+    found = {}
+    for k in base:
+        if k == "seed" or k in SCORES or k not in new:
+            continue
+        a, b = base[k][i], new[k][j]
+        same = (a == b) | (np.isnan(a) & np.isnan(b))
+        if same.all() and np.isfinite(a).any():
+            found[k] = a
+    return found
+
+
+def bins(values):
+    # 値の種類が少なければそのまま、多ければ分位点で区切る
+    import numpy as np
+    finite = values[np.isfinite(values)]
+    uniques = np.unique(finite)
+    if len(uniques) <= BINS * 2:
+        return [(f"{u:g}", values == u) for u in uniques]
+    edges = np.unique(np.quantile(finite, np.linspace(0, 1, BINS + 1)))
+    result = []
+    for k in range(len(edges) - 1):
+        lo, hi = edges[k], edges[k + 1]
+        mask = (values >= lo) & ((values < hi) if k < len(edges) - 2 else (values <= hi))
+        result.append((f"[{lo:g}, {hi:g}]", mask))
+    return result
+
+
+def compare(base, new, minimize=False):
+    import numpy as np
+    seeds, i, j = align(base, new)
+    a = base.get("Score", np.full(len(base["seed"]), np.nan))[i]
+    b = new.get("Score", np.full(len(new["seed"]), np.nan))[j]
+    valid = np.isfinite(a) & np.isfinite(b)
+    sign = -1.0 if minimize else 1.0
+    diff = sign * (b - a)
+    # 相対改善率、base が 0 のシードは 1 で割る
+    rel = diff / np.maximum(np.abs(a), 1.0)
+    lines = []
+    n = int(valid.sum())
+    win = int((diff[valid] > 0).sum())
+    loss = int((diff[valid] < 0).sum())
+    lines.append(f"seeds = {n}  win = {win}  loss = {loss}  tie = {n - win - loss}")
+    if n == 0:
+        return "\n".join(lines)
+    lines.append(f"mean score: {np.mean(a[valid]):.2f} -> {np.mean(b[valid]):.2f}")
+    qs = np.quantile(rel[valid], QUANTILES)
+    lines.append("relative improvement: mean = {:+.4f}  ".format(np.mean(rel[valid])) + "  ".join(f"{int(q * 100)}% = {v:+.4f}" for q, v in zip(QUANTILES, qs)))
+
+    found = params(base, new, i, j)
+    regressions = []
+    for name, values in found.items():
+        for label, mask in bins(values):
+            mask = mask & valid
+            if not mask.any():
+                continue
+            mean = float(np.mean(rel[mask]))
+            if mean < 0:
+                regressions.append((mean, name, label, int(mask.sum()), int((diff[mask] < 0).sum())))
+    if regressions:
+        lines.append("regressions by parameter:")
+        for mean, name, label, count, losses in sorted(regressions):
+            lines.append(f"  {name} in {label}: seeds = {count}  loss = {losses}  mean rel = {mean:+.4f}")
+
+    worst = np.argsort(np.where(valid, rel, np.inf))[:5]
+    lines.append("worst seeds: " + "  ".join(f"{int(seeds[k]):04}({rel[k]:+.4f})" for k in worst if valid[k]))
+    return "\n".join(lines)
+
+
+def main(contest_resource_path, refs, minimize=False):
+    resultpath = Path(contest_resource_path) / "result"
+    history = ahc_store.load_history(resultpath)
+    if len(refs) < 2:
+        refs = ["best", "latest"]
+    rundirs = []
+    for ref in refs:
+        rundir = resolve(resultpath, ref, history, minimize)
+        if rundir is None:
+            print(f"result not found: {ref}")
+            return
+        rundirs.append(rundir)
+
+    base = ahc_store.load_run(rundirs[0])
+    for rundir in rundirs[1:]:
+        print(f"{rundirs[0].name} -> {rundir.name}")
+        print(compare(base, ahc_store.load_run(rundir), minimize))
+        print()
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+from src import ahc_runner
+
+CACHEFILE = "gen_cache.json"
+WORKDIR = ".gen"
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_cache(tools_dir):
+    path = Path(tools_dir) / CACHEFILE
+    if not path.exists():
+        return {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+
+def save_cache(tools_dir, cache):
+    path = Path(tools_dir) / CACHEFILE
+    with open(path.with_suffix(".tmp"), "w") as f:
+        json.dump(cache, f)
+    os.replace(path.with_suffix(".tmp"), path)
+
+
+def is_valid(entry, path, seed, genhash):
+    if entry is None or not path.exists():
+        return False
+    stat = path.stat()
+    return entry["seed"] == seed and entry["gen"] == genhash and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns
+
+
+def write_seeds(tools_dir, seeds):
+    # seeds.txt は ahc_analyze が読むので、内容が変わったときだけ書き直す
+    path = Path(tools_dir) / "seeds.txt"
+    text = "\n".join(str(s) for s in seeds)
+    if not path.exists() or path.read_text() != text:
+        path.write_text(text)
+
+
+async def generate(tools_dir, genexe, n, parallel=None):
+    # in/{i:04}.txt (seed = i) のうち無い・古いものだけを gen で作る
+    tools_dir = Path(tools_dir)
+    indir = tools_dir / "in"
+    indir.mkdir(parents=True, exist_ok=True)
+    seeds = list(range(n))
+    write_seeds(tools_dir, seeds)
+
+    genhash = file_hash(genexe)
+    cache = load_cache(tools_dir)
+    name = lambda seed: str(seed).zfill(4) + ".txt"
+    missing = [s for s in seeds if not is_valid(cache.get(name(s)), indir / name(s), s, genhash)]
+    if not missing:
+        return 0
+
+    # gen は seeds.txt の行番号でファイル名を付けるので、チャンクごとに別ディレクトリで動かしてから並べ直す
+    parallel = parallel or ahc_runner.default_parallel()
+    k = min(parallel, len(missing))
+    chunks = [missing[i::k] for i in range(k)]
+    workdir = tools_dir / WORKDIR
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    def job(i, chunk):
+        chunkdir = workdir / str(i)
+        chunkdir.mkdir(parents=True, exist_ok=True)
+        (chunkdir / "seeds.txt").write_text("\n".join(str(s) for s in chunk))
+        return ahc_runner.run([Path(genexe).absolute(), "seeds.txt"], cwd=chunkdir)
+
+    results = await ahc_runner.run_all([(str(i), lambda i=i, chunk=chunk: job(i, chunk)) for i, chunk in enumerate(chunks)], k, "gen")
+
+    # 出来たものは置いてキャッシュに入れ、落ちたチャンクと出来なかったシードは最後にまとめてエラーにする
+    failed = [f"chunk {i} (exit code {results[str(i)][0]})" for i in range(k) if results[str(i)][0] != 0]
+    lost = []
+    for i, chunk in enumerate(chunks):
+        for j, seed in enumerate(chunk):
+            src = workdir / str(i) / "in" / name(j)
+            if not src.exists():
+                lost.append(seed)
+                continue
+            os.replace(src, indir / name(seed))
+            stat = (indir / name(seed)).stat()
+            cache[name(seed)] = {"seed": seed, "gen": genhash, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+    shutil.rmtree(workdir, ignore_errors=True)
+    save_cache(tools_dir, cache)
+    if failed or lost:
+        seeds = ", ".join(str(s) for s in sorted(lost)[:10]) + (" ..." if len(lost) > 10 else "")
+        raise Exception(f"gen error: {', '.join(failed) or 'no failed chunk'}; missing seeds: {seeds or 'none'}")
+    return len(missing)
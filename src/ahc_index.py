@@ -0,0 +1,196 @@
+"""
+result/ の全 run の要約を SQLite に持ち、ahcsubmit などで選ぶときに 1 回のクエリで引けるようにする
+
+result/index.sqlite : run ごとに 1 行 (date, ソースのハッシュ, git のコミット, 平均・中央値, 大きいケースの平均, 実行時間, metrics.npz のパス, 打ち切ったか)
+途中で打ち切った run (--compare) は平均が別のシードの集合なので、latest と日付の指定以外では選ばない
+シードごとのスコアは result/<date>/metrics.npz にあるので、ここにはパスだけを置く
+「大きいケース」は入力サイズ (指標 size_key、無ければ入力の先頭の数) が上位 1/4 のシード
+
+python -m src.ahc_index sync contest/ahc024/a/result   (index に無い過去の run を足す)
+"""
+import hashlib
+import os
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+INDEX = "index.sqlite"
+COLUMNS = [
+    ("date", "TEXT PRIMARY KEY"),
+    ("source", "TEXT"),
+    ("source_hash", "TEXT"),
+    ("git_commit", "TEXT"),
+    ("seeds", "INTEGER"),
+    ("mean", "REAL"),
+    ("median", "REAL"),
+    ("large_mean", "REAL"),
+    ("time_mean", "REAL"),
+    ("time_max", "REAL"),
+    ("memory_max", "REAL"),
+    ("metrics", "TEXT"),
+    ("partial", "INTEGER"),
+]
+# select で使えるもの (タグ -> 並べる列)
+ORDER = {
+    "best": "mean",
+    "median": "median",
+    "large": "large_mean",
+    "budget": "mean",
+}
+LARGE = 0.75
+
+
+def connect(resultpath):
+    conn = sqlite3.connect(Path(resultpath) / INDEX, timeout=30)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS runs ({', '.join(f'{k} {t}' for k, t in COLUMNS)})")
+    # 列を足す前に作った index
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(runs)")}
+    for k, t in COLUMNS:
+        if k not in existing:
+            conn.execute(f"ALTER TABLE runs ADD COLUMN {k} {t}")
+    conn.execute("CREATE INDEX IF NOT EXISTS runs_time ON runs (time_max)")
+    return conn
+
+
+def source_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def git_commit(path):
+    # ソースのディレクトリの HEAD、git でなければ None
+    try:
+        p = subprocess.run(["git", "-C", str(Path(path).parent), "rev-parse", "HEAD"], capture_output=True, text=True)
+    except OSError:
+        return None
+    return p.stdout.strip() if p.returncode == 0 else None
+
+
+def input_size(inpath):
+    # 入力の先頭の数 (ほとんどの AHC では N)
+    try:
+        with open(inpath, "rb") as f:
+            return float(f.readline().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def finite_or_none(x):
+    import math
+    x = float(x)
+    return x if math.isfinite(x) else None
+
+
+def summarize(run, sizes=None):
+    # run = ahc_store.load_run の戻り値、sizes = シードごとの入力サイズ (run["seed"] と同じ並び)
+    import numpy as np
+    n = len(run["seed"])
+    score = run.get("Score", np.full(n, np.nan))
+    finite = np.isfinite(score)
+    summary = {"seeds": n, "mean": None, "median": None, "large_mean": None, "time_mean": None, "time_max": None, "memory_max": None}
+    if finite.any():
+        summary["mean"] = finite_or_none(score[finite].mean())
+        summary["median"] = finite_or_none(np.median(score[finite]))
+    if sizes is not None:
+        sizes = np.asarray(sizes, dtype=np.float64)
+        known = np.isfinite(sizes) & finite
+        if known.any():
+            large = known & (sizes >= np.quantile(sizes[known], LARGE))
+            summary["large_mean"] = finite_or_none(score[large].mean())
+    for key, column, f in [("run_time", "time_mean", np.nanmean), ("run_time", "time_max", np.nanmax), ("maxrss_mb", "memory_max", np.nanmax)]:
+        if key in run and np.isfinite(run[key]).any():
+            summary[column] = finite_or_none(f(run[key]))
+    return summary
+
+
+def sizes_of(run, inputdir, size_key="N"):
+    # 指標に size_key があればそれ、無ければ入力ファイルの先頭の数
+    if size_key in run:
+        return run[size_key]
+    return [input_size(Path(inputdir) / (str(seed).zfill(4) + ".txt")) or float("nan") for seed in run["seed"]]
+
+
+def record(resultpath, date, run, source_path=None, sizes=None, commit=None, partial=False):
+    # 1 run 分を書く (同じ date があれば置き換える)
+    from src import ahc_store
+    row = summarize(run, sizes)
+    row["date"] = date
+    row["partial"] = int(bool(partial))
+    row["metrics"] = str(Path(date) / ahc_store.METRICS)
+    if source_path is not None and Path(source_path).exists():
+        row["source"] = Path(source_path).name
+        row["source_hash"] = source_hash(source_path)
+        row["git_commit"] = commit
+    keys = [k for k, _ in COLUMNS if k in row]
+    conn = connect(resultpath)
+    with conn:
+        conn.execute(f"INSERT OR REPLACE INTO runs ({', '.join(keys)}) VALUES ({', '.join('?' * len(keys))})", [row[k] for k in keys])
+    conn.close()
+    return row
+
+
+def sync(resultpath, inputdir=None, size_key="N"):
+    # result/<date>/ のうち index に無い run を足す (コミットは分からないので空)、足した数を返す
+    from src import ahc_store
+    resultpath = Path(resultpath)
+    conn = connect(resultpath)
+    known = {date for date, in conn.execute("SELECT date FROM runs")}
+    conn.close()
+    added = 0
+    for rundir in sorted(resultpath.iterdir()):
+        if not rundir.is_dir() or not rundir.name.isdigit() or rundir.name in known:
+            continue
+        if not (rundir / ahc_store.METRICS).exists() and not (rundir / "other").exists() and not (rundir / "manifest.json").exists():
+            continue
+        run = ahc_store.load_run(rundir)
+        sources = [p for p in rundir.iterdir() if p.suffix in (".py", ".rs")]
+        sizes = sizes_of(run, inputdir, size_key) if inputdir is not None else None
+        record(resultpath, rundir.name, run, sources[0] if sources else None, sizes, partial=(rundir / ahc_store.PARTIAL).exists())
+        added += 1
+    return added
+
+
+def select(resultpath, tag, minimize=False, budget=None):
+    # タグに当たる run の行 (dict) を返す、無ければ None
+    # best / median / large / budget (time_max <= budget の中で平均が一番) / latest / <date>
+    conn = connect(resultpath)
+    conn.row_factory = sqlite3.Row
+    try:
+        if tag == "latest":
+            row = conn.execute("SELECT * FROM runs ORDER BY date DESC LIMIT 1").fetchone()
+        elif tag in ORDER:
+            column = ORDER[tag]
+            where = f"{column} IS NOT NULL AND NOT COALESCE(partial, 0)"
+            params = []
+            if tag == "budget":
+                if budget is None:
+                    return None
+                where += " AND time_max <= ?"
+                params.append(budget)
+            row = conn.execute(f"SELECT * FROM runs WHERE {where} ORDER BY {column} {'ASC' if minimize else 'DESC'}, date DESC LIMIT 1", params).fetchone()
+        else:
+            row = conn.execute("SELECT * FROM runs WHERE date = ?", [tag]).fetchone()
+        return dict(row) if row is not None else None
+    finally:
+        conn.close()
+
+
+def describe(row):
+    if row is None:
+        return "-"
+
+    def fmt(x):
+        return "-" if x is None else f"{x:.3f}" if isinstance(x, float) else str(x)
+    commit = (row.get("git_commit") or "")[:8]
+    partial = f" (partial, {row['seeds']} seeds)" if row.get("partial") else ""
+    return f"{row['date']} mean {fmt(row['mean'])} median {fmt(row['median'])} large {fmt(row['large_mean'])} time_max {fmt(row['time_max'])}s {commit}".rstrip() + partial
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "sync":
+        print(__doc__)
+        sys.exit(1)
+    resultpath = Path(sys.argv[2])
+    inputdir = resultpath.parent / "tools" / "in"
+    print(f"{sync(resultpath, inputdir if inputdir.exists() else None)} runs added to {os.path.join(resultpath, INDEX)}")
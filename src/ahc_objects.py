@@ -0,0 +1,142 @@
+"""
+result の out / other / usage を内容のハッシュで重複を除いて圧縮して持つ
+
+result/objects/<date>.pack      : その run で初めて出てきた中身を 1 つずつ gzip して繋げたもの (全体も gzip として読める)
+result/objects/index.sqlite     : ハッシュ -> (pack, offset, length)、1 シード分だけ seek して展開できる
+result/<date>/manifest.json     : {"out": {"0000.txt": ハッシュ, ...}, "other": {...}, "usage": {...}}
+
+python src/ahc_objects.py pack contest/ahc024/a/result   (ファイルのまま残っている過去の run をまとめる)
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+from pathlib import Path
+
+OBJECTS = "objects"
+INDEX = "index.sqlite"
+MANIFEST = "manifest.json"
+# 取り出したファイルを置く場所 (vis に渡すときなど、パスが要るとき)
+CACHEDIR = Path(".temp") / "objects"
+
+
+def connect(resultpath):
+    objects = Path(resultpath) / OBJECTS
+    objects.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(objects / INDEX, timeout=30)
+    conn.execute("CREATE TABLE IF NOT EXISTS objects (hash TEXT PRIMARY KEY, pack TEXT, offset INTEGER, length INTEGER, size INTEGER)")
+    return conn
+
+
+def archive(resultpath, date, directories):
+    # directories = {名前: ディレクトリ} の中身を result/<date>/manifest.json と pack に入れる
+    # 戻り値 = (新しく入れた数, ファイルの数)
+    resultpath = Path(resultpath)
+    conn = connect(resultpath)
+    pack = f"{date}.pack"
+    packpath = resultpath / OBJECTS / pack
+    manifest = {}
+    new = total = 0
+    # ファイルを閉じてから index を commit する (index にあるものは必ず pack にある)
+    with conn, open(packpath, "ab") as f:
+        for name, directory in directories.items():
+            directory = Path(directory)
+            if not directory.is_dir():
+                continue
+            entries = {}
+            for path in sorted(directory.iterdir()):
+                data = path.read_bytes()
+                digest = hashlib.sha256(data).hexdigest()
+                entries[path.name] = digest
+                total += 1
+                if conn.execute("SELECT 1 FROM objects WHERE hash = ?", (digest,)).fetchone():
+                    continue
+                blob = gzip.compress(data, mtime=0)
+                conn.execute("INSERT INTO objects VALUES (?, ?, ?, ?, ?)", (digest, pack, f.tell(), len(blob), len(data)))
+                f.write(blob)
+                new += 1
+            manifest[name] = entries
+    conn.close()
+    if packpath.stat().st_size == 0:
+        packpath.unlink()
+
+    rundir = resultpath / date
+    rundir.mkdir(parents=True, exist_ok=True)
+    tmp = rundir / ("." + MANIFEST)
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, rundir / MANIFEST)
+    return new, total
+
+
+class Reader:
+    # result/<date> のファイルを読む、manifest の無い古い run はディレクトリのファイルをそのまま読む
+    def __init__(self, rundir):
+        self.rundir = Path(rundir)
+        path = self.rundir / MANIFEST
+        self.manifest = json.loads(path.read_text()) if path.exists() else {}
+        self.conn = None
+
+    def seeds(self, name):
+        if (self.rundir / name).is_dir():
+            return sorted(p.name for p in (self.rundir / name).iterdir())
+        return sorted(self.manifest.get(name, {}))
+
+    def locate(self, digest):
+        if self.conn is None:
+            self.conn = connect(self.rundir.parent)
+        return self.conn.execute("SELECT pack, offset, length FROM objects WHERE hash = ?", (digest,)).fetchone()
+
+    def read(self, name, seed):
+        path = self.rundir / name / seed
+        if path.exists():
+            return path.read_bytes()
+        digest = self.manifest.get(name, {}).get(seed)
+        if digest is None:
+            return None
+        pack, offset, length = self.locate(digest)
+        with open(self.rundir.parent / OBJECTS / pack, "rb") as f:
+            f.seek(offset)
+            return gzip.decompress(f.read(length))
+
+    def path(self, name, seed):
+        # 実ファイルのパスを返す、pack にあるものは .temp/objects/<hash> に取り出す
+        path = self.rundir / name / seed
+        if path.exists():
+            return path
+        digest = self.manifest.get(name, {}).get(seed)
+        if digest is None:
+            return None
+        path = CACHEDIR / digest
+        if not path.exists():
+            CACHEDIR.mkdir(parents=True, exist_ok=True)
+            tmp = CACHEDIR / ("." + digest)
+            tmp.write_bytes(self.read(name, seed))
+            os.replace(tmp, path)
+        return path
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def pack_all(resultpath, names=("out", "other", "usage")):
+    # ファイルのまま残っている run を pack に入れてディレクトリを消す
+    resultpath = Path(resultpath)
+    for rundir in sorted(p for p in resultpath.iterdir() if (p / "other").is_dir()):
+        new, total = archive(resultpath, rundir.name, {name: rundir / name for name in names})
+        for name in names:
+            shutil.rmtree(rundir / name, ignore_errors=True)
+        print(f"{rundir.name}: {total} files, {new} new objects")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "pack":
+        pack_all(sys.argv[2])
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+COMPOSE = "compose.yml"
+
+
+def compose_value(service, name, compose_path=COMPOSE):
+    # compose.yml から service 以下の name の値を読む (yaml は入れていないので行単位で見る)
+    if not Path(compose_path).exists():
+        return None
+    current = None
+    with open(compose_path, "r") as f:
+        for line in f:
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            indent = len(line) - len(line.lstrip())
+            key = line.strip()
+            if indent == 2 and key.endswith(":"):
+                current = key[:-1]
+            elif current == service and key.startswith(name + ":"):
+                return key.split(":", 1)[1].strip().strip("'\"")
+    return None
+
+
+def compose_cpus(service, compose_path=COMPOSE):
+    # deploy.resources.limits.cpus
+    try:
+        return float(compose_value(service, "cpus", compose_path))
+    except (TypeError, ValueError):
+        return None
+
+
+def default_parallel(service=None):
+    # コア数が基本、コンテナ内で動かすものはそのサービスの cpus 制限を超えない
+    n = os.cpu_count() or 1
+    if service is not None:
+        cpus = compose_cpus(service)
+        if cpus:
+            n = min(n, max(1, int(cpus)))
+    return n
+
+
+async def run(argv, stdin=None, stdout=None, stderr=None, timeout=None, append=False, cwd=None, env=None):
+    # shell を通さずに実行する、stdin/stdout/stderr はファイルパス
+    # stdout は append=True で追記、stderr は常に追記 (other/ に積んでいくため)
+    files = []
+    try:
+        fin = open(stdin, "rb") if stdin is not None else asyncio.subprocess.DEVNULL
+        if stdin is not None:
+            files.append(fin)
+        fout = open(stdout, "ab" if append else "wb") if stdout is not None else asyncio.subprocess.DEVNULL
+        if stdout is not None:
+            files.append(fout)
+        if stderr is not None and stderr == stdout:
+            ferr = fout
+        elif stderr is not None:
+            ferr = open(stderr, "ab")
+            files.append(ferr)
+        else:
+            ferr = asyncio.subprocess.DEVNULL
+
+        proc = await asyncio.create_subprocess_exec(*[str(a) for a in argv], stdin=fin, stdout=fout, stderr=ferr, cwd=cwd, env=env)
+        try:
+            return await asyncio.wait_for(proc.wait(), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            return None
+    finally:
+        for f in files:
+            f.close()
+
+
+def progress(label, done, total, start):
+    elapsed = time.perf_counter() - start
+    sys.stderr.write(f"\r[{label}] {done}/{total} ({elapsed:.1f}s)")
+    sys.stderr.flush()
+
+
+async def run_all(jobs, parallel, label="", on_done=None):
+    # jobs = [(name, コルーチンを返す関数)], 同時実行数を parallel に抑える
+    # on_done(name, 結果, wall time) は枠を空けてから呼ぶので、後段の処理と重ねられる
+    # on_done が True を返したら、まだ始まっていない job は実行しない
+    # label が None なら進捗は出さない (on_done 側で出す)
+    # 戻り値 = {name: (結果, wall time)}
+    semaphore = asyncio.Semaphore(max(1, parallel))
+    results = {}
+    done = 0
+    stopped = False
+    start = time.perf_counter()
+
+    async def worker(name, job):
+        nonlocal done, stopped
+        async with semaphore:
+            if stopped:
+                return
+            t = time.perf_counter()
+            ret = await job()
+            wall = time.perf_counter() - t
+        results[name] = (ret, wall)
+        if on_done is not None and await on_done(name, ret, wall):
+            stopped = True
+        done += 1
+        if label is not None:
+            progress(label, done, len(jobs), start)
+
+    await asyncio.gather(*[worker(name, job) for name, job in jobs])
+    if jobs:
+        sys.stderr.write("\n")
+    return results
+
+
+def report(label, results, k=5):
+    if not results:
+        return
+    walls = sorted(((wall, name) for name, (_, wall) in results.items()), reverse=True)
+    mean = sum(w for w, _ in walls) / len(walls)
+    print(f"[{label}] wall mean = {mean:.3f}s, max = {walls[0][0]:.3f}s")
+    for wall, name in walls[:k]:
+        print(f"  {name}: {wall:.3f}s")
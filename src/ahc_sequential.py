@@ -0,0 +1,78 @@
+import math
+from pathlib import Path
+
+from src import ahc_analyze
+
+# 何度も検定するので、片側 1% より厳しめの境界にしておく
+BOUNDARY = 3.0
+MIN_SEEDS = 20
+
+
+def load_scores(resultpath):
+    # score.txt = "date = mean" の行 (途中で打ち切った run は後ろに "  # partial k/n" が付く)
+    scores = []
+    if not (Path(resultpath) / "score.txt").exists():
+        return scores
+    with open(Path(resultpath) / "score.txt", "r") as f:
+        for l in f:
+            if " = " not in l:
+                continue
+            date, score = l.split("#")[0].strip().split(" = ")[:2]
+            try:
+                score = float(score)
+            except ValueError:
+                continue
+            if not math.isnan(score):
+                scores.append((date, score))
+    return scores
+
+
+def reference_date(resultpath, tag, minimize=False):
+    from src import ahc_store
+    date = ahc_store.select(ahc_store.load_history(resultpath), tag, minimize)
+    return date if date is not None and (Path(resultpath) / date).exists() else None
+
+
+def load_reference(rundir):
+    # シードごとの logscore
+    from src import ahc_store
+    run = ahc_store.load_run(rundir)
+    if "Score" not in run:
+        return {}
+    return {str(seed).zfill(4) + ".txt": math.log(score + 1) for seed, score in zip(run["seed"].tolist(), run["Score"].tolist()) if not math.isnan(score)}
+
+
+class SequentialTest:
+    # 同じシードでの logscore の差で対応のある t 検定を逐次に行う
+    def __init__(self, reference, minimize=False, boundary=BOUNDARY, min_seeds=MIN_SEEDS):
+        self.reference = reference
+        self.sign = -1 if minimize else 1
+        self.boundary = boundary
+        self.min_seeds = min_seeds
+        self.stat = ahc_analyze.Stat()
+        self.verdict = None
+
+    def add(self, path, output):
+        score = output.get("Score")
+        if path not in self.reference or not isinstance(score, float):
+            return self.verdict
+        self.stat.add(self.sign * (math.log(score + 1) - self.reference[path]))
+        if self.verdict is None and self.stat.count >= self.min_seeds:
+            t = self.t()
+            if t >= self.boundary:
+                self.verdict = "better"
+            elif t <= -self.boundary:
+                self.verdict = "worse"
+        return self.verdict
+
+    def t(self):
+        if self.stat.count < 2:
+            return 0.0
+        std = self.stat.std
+        if std == 0:
+            return 0.0 if self.stat.mean == 0 else math.copysign(math.inf, self.stat.mean)
+        return self.stat.mean / (std / math.sqrt(self.stat.count))
+
+    def summary(self):
+        verdict = self.verdict or "undecided"
+        return f"{verdict} (seeds = {self.stat.count}, mean logscore diff = {self.stat.mean:+.4f}, t = {self.t():+.2f})"
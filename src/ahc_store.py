@@ -0,0 +1,133 @@
+import os
+from pathlib import Path
+
+from src import ahc_analyze
+
+# result/<date>/metrics.npz : seed と各指標の列 (無い値は nan)
+# result/history.npz        : 全 run の dates, seeds, mean, partial とスコアの行列 (run x seed)
+# result/<date>/partial     : 途中で打ち切った run の印 ("流したシード数/全シード数")
+#                             平均が別のシードの集合になるので best / min / max では選ばない
+METRICS = "metrics.npz"
+HISTORY = "history.npz"
+PARTIAL = "partial"
+
+
+def seed_of(path):
+    return int(Path(path).stem)
+
+
+def save_npz(path, **arrays):
+    import numpy as np
+    path = Path(path)
+    tmp = path.with_name("." + path.name)
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+
+def write_run(rundir, rows):
+    # rows = [(path, output)]、数値の指標だけを列にする
+    import numpy as np
+    columns = {}
+    for i, (_, output) in enumerate(rows):
+        for k, v in output.items():
+            if isinstance(v, float):
+                if k not in columns:
+                    columns[k] = np.full(len(rows), np.nan)
+                columns[k][i] = v
+    seeds = np.array([seed_of(p) for p, _ in rows], dtype=np.int64)
+    save_npz(Path(rundir) / METRICS, seed=seeds, **{"m_" + k: v for k, v in columns.items()})
+
+
+def load_run(rundir):
+    # {"seed": ..., 指標名: ...} を返す、無ければ保存済みの other/ などから作り直す
+    import numpy as np
+    from src import ahc_objects
+    rundir = Path(rundir)
+    if not (rundir / METRICS).exists():
+        reader = ahc_objects.Reader(rundir)
+        rows = [(path, ahc_analyze.parse_run(reader, path)) for path in reader.seeds("other")]
+        reader.close()
+        write_run(rundir, rows)
+    with np.load(rundir / METRICS) as data:
+        run = {"seed": data["seed"]}
+        for k in data.files:
+            if k.startswith("m_"):
+                run[k[2:]] = data[k]
+    return run
+
+
+def load_history(resultpath):
+    import numpy as np
+    resultpath = Path(resultpath)
+    if not (resultpath / HISTORY).exists():
+        return rebuild_history(resultpath)
+    with np.load(resultpath / HISTORY) as data:
+        history = {k: data[k] for k in data.files}
+    # partial を持つ前に作った履歴
+    history.setdefault("partial", np.zeros(len(history["dates"]), dtype=bool))
+    return history
+
+
+def empty_history():
+    import numpy as np
+    return {
+        "dates": np.array([], dtype="U32"),
+        "seeds": np.array([], dtype=np.int64),
+        "mean": np.array([], dtype=np.float64),
+        "partial": np.array([], dtype=bool),
+        "score": np.zeros((0, 0), dtype=np.float64),
+    }
+
+
+def append_history(resultpath, date, run, history=None, partial=False):
+    # run のスコア列を seed で揃えて 1 行足す
+    import numpy as np
+    history = history if history is not None else load_history(resultpath)
+    score = run.get("Score", np.full(len(run["seed"]), np.nan))
+    seeds = np.union1d(history["seeds"], run["seed"])
+    matrix = np.full((len(history["dates"]) + 1, len(seeds)), np.nan)
+    if len(history["seeds"]):
+        matrix[:-1, np.searchsorted(seeds, history["seeds"])] = history["score"]
+    matrix[-1, np.searchsorted(seeds, run["seed"])] = score
+    mean = np.nanmean(score) if np.isfinite(score).any() else np.nan
+    history = {
+        "dates": np.append(history["dates"], date).astype("U32"),
+        "seeds": seeds,
+        "mean": np.append(history["mean"], mean),
+        "partial": np.append(history["partial"], bool(partial)).astype(bool),
+        "score": matrix,
+    }
+    save_npz(Path(resultpath) / HISTORY, **history)
+    return history
+
+
+def rebuild_history(resultpath):
+    # history.npz が無いときに score.txt と result/<date> から作る (初回だけ)
+    from src import ahc_sequential
+    resultpath = Path(resultpath)
+    history = empty_history()
+    for date, _ in ahc_sequential.load_scores(resultpath):
+        if (resultpath / date).exists():
+            history = append_history(resultpath, date, load_run(resultpath / date), history, partial=(resultpath / date / PARTIAL).exists())
+    return history
+
+
+def select(history, tag, minimize=False):
+    # best / latest / min / max / <date> に当たる run の date を返す (best / min / max は打ち切った run を除く)
+    import numpy as np
+    dates, mean = history["dates"], history["mean"]
+    if not len(dates):
+        return None
+    if tag == "latest":
+        return str(dates[-1])
+    finite = np.isfinite(mean) & ~history["partial"]
+    if not finite.any():
+        return None
+    if tag == "best":
+        tag = "min" if minimize else "max"
+    if tag == "min":
+        return str(dates[np.where(finite, mean, np.inf).argmin()])
+    if tag == "max":
+        return str(dates[np.where(finite, mean, -np.inf).argmax()])
+    return tag if tag in dates else None
@@ -0,0 +1,125 @@
+"""
+ahctest の上でパラメータを探索する (successive halving)
+
+python manage.py ahc024 python tune a --trials=16 --tune_seeds=100
+
+contest/<contest>/config.toml の [tune] (タスクごとなら [a.tune]) に探索範囲を書く
+[tune]
+TEMP = [10.0, 1000.0]   # 数 2 つは範囲 (両方 int なら整数、100 倍以上離れていれば対数スケール)
+ITER = [1000, 5000]
+MODE = ["a", "b", "c"]  # それ以外は選択肢
+
+パラメータは環境変数で解答に渡すので、解答側は os.environ.get("TEMP", "100") のように読む
+trial 0 は何も渡さない (= 解答の既定値) ので、それより良くなったかが分かる
+"""
+import json
+import math
+import random
+from pathlib import Path
+
+from src import ahc_runner
+
+ETA = 3
+
+
+def is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def parse_space(tune):
+    # {名前: ("int" | "float", lo, hi, log) | ("choice", [値])}
+    space = {}
+    for name, values in tune.items():
+        if isinstance(values, list) and len(values) == 2 and all(is_number(v) for v in values):
+            lo, hi = sorted(values)
+            kind = "int" if all(isinstance(v, int) for v in values) else "float"
+            space[name] = (kind, lo, hi, lo > 0 and hi >= lo * 100)
+        elif isinstance(values, list):
+            space[name] = ("choice", values)
+        else:
+            space[name] = ("choice", [values])
+    return space
+
+
+def sample(space, rng):
+    params = {}
+    for name, (kind, *args) in space.items():
+        if kind == "choice":
+            params[name] = rng.choice(args[0])
+            continue
+        lo, hi, log = args
+        x = math.exp(rng.uniform(math.log(lo), math.log(hi))) if log else rng.uniform(lo, hi)
+        params[name] = round(x) if kind == "int" else float(f"{x:.4g}")
+    return params
+
+
+def environ(params):
+    return {k: str(v) for k, v in params.items()}
+
+
+def mean_score(outputs, seeds):
+    values = [outputs[s]["Score"] for s in seeds if isinstance(outputs.get(s, {}).get("Score"), float)]
+    return sum(values) / len(values) if values else math.nan
+
+
+def rank_key(outputs, seeds, minimize=False):
+    # Score が無い (落ちた) シードがある trial は後ろに回す
+    missing = sum(1 for s in seeds if not isinstance(outputs.get(s, {}).get("Score"), float))
+    mean = mean_score(outputs, seeds)
+    return missing, math.inf if math.isnan(mean) else (mean if minimize else -mean)
+
+
+async def successive_halving(space, seeds, test, finish, parallel, trials=16, min_seeds=10, eta=ETA, minimize=False, rng=None):
+    # test(trial, params, seed) はプロセスを動かすコルーチン、finish(trial, seed) は枠を空けてから vis と解析をして output を返す
+    # 段ごとに残った trial の (trial, seed) を 1 つの run_all にまとめて流すので、trial をまたいで枠が埋まる
+    # 戻り値 = (configs, {trial: {seed: output}}, 良い順の trial, {trial: 最後に評価したシード数})
+    rng = rng or random.Random()
+    configs = [{}] + [sample(space, rng) for _ in range(max(1, trials) - 1)]
+    outputs = {t: {} for t in range(len(configs))}
+    reached = {t: 0 for t in range(len(configs))}
+    alive = list(range(len(configs)))
+    budget = min_seeds
+    while True:
+        budget = min(budget, len(seeds))
+        rung = seeds[:budget]
+        # 前の段で流したシードはそのまま使う
+        jobs = [
+            ((t, seed), lambda t=t, seed=seed: test(t, configs[t], seed))
+            for t in alive for seed in rung if seed not in outputs[t]
+        ]
+
+        async def done(key, ret, wall):
+            t, seed = key
+            outputs[t][seed] = await finish(t, seed)
+
+        await ahc_runner.run_all(jobs, parallel, f"tune {len(alive)} x {budget}", on_done=done)
+        ranked = sorted(alive, key=lambda t: rank_key(outputs[t], rung, minimize))
+        for t in alive:
+            reached[t] = budget
+        print(f"[tune] {len(alive)} trials x {budget} seeds")
+        for t in ranked:
+            print(f"  {t:3d}: {mean_score(outputs[t], rung):.2f} {configs[t] or '(default)'}")
+        if budget == len(seeds):
+            break
+        alive = ranked[:max(1, len(alive) // eta)]
+        # 1 つだけ残ったら、途中の段を飛ばしてすべてのシード (tune_seeds) で流す
+        budget = len(seeds) if len(alive) == 1 else budget * eta
+    others = sorted((t for t in outputs if t not in ranked), key=lambda t: (-reached[t], rank_key(outputs[t], seeds[:reached[t]], minimize)))
+    return configs, outputs, ranked + others, reached
+
+
+def record(tunepath, configs, outputs, ranked, reached):
+    # tunepath/<trial>/metrics.npz と tunepath/trials.json に全 trial を残す (通常の履歴には足さない)
+    from src import ahc_store
+    tunepath = Path(tunepath)
+    trials = []
+    for t in ranked:
+        rundir = tunepath / f"{t:03d}"
+        rundir.mkdir(parents=True, exist_ok=True)
+        ahc_store.write_run(rundir, sorted(outputs[t].items()))
+        seeds = sorted(outputs[t])
+        trials.append({"trial": t, "params": configs[t], "seeds": reached[t], "Score": mean_score(outputs[t], seeds)})
+    with open(tunepath / "trials.json", "w") as f:
+        json.dump(trials, f, indent=2)
+    return trials
+
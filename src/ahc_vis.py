@@ -0,0 +1,103 @@
+"""
+vis の実行を、スコアを取る部分と描画を残す部分に分ける
+
+スコア: シードごとに作業ディレクトリを分けて vis を並列に流し、標準出力 (Score = ...) だけを other に足す
+描画:   python manage.py ahc024 render a [latest|<date>] [seed...] --worst=5
+        指定したシード (無ければ悪い方から worst 個) だけ vis の生成物 (vis.html など) を result/<date>/vis/ に置く
+どちらも (vis のハッシュ, 入力のハッシュ, 出力のハッシュ) をキーに .temp/vis/<key>/ にキャッシュし、同じ出力は vis し直さない
+"""
+import functools
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from src import ahc_runner
+
+CACHEDIR = Path(".temp") / "vis"
+SCORE = "score.txt"
+RENDER = "render"
+
+
+@functools.lru_cache(maxsize=None)
+def binary_hash(path, mtime_ns, size):
+    # シードごとに読み直さないよう、同じ (パス, 更新時刻, サイズ) なら覚えておく
+    from src import ahc_gen
+    return ahc_gen.file_hash(path)
+
+
+def key(visexe, inpath, outpath):
+    # キャッシュは全コンテスト・全タスクで共有なので、vis の中身もキーに入れる
+    stat = Path(visexe).stat()
+    h = hashlib.sha256()
+    h.update(binary_hash(str(Path(visexe).absolute()), stat.st_mtime_ns, stat.st_size).encode())
+    h.update(b"\0")
+    h.update(Path(inpath).read_bytes())
+    h.update(b"\0")
+    h.update(Path(outpath).read_bytes() if Path(outpath).exists() else b"")
+    return h.hexdigest()[:32]
+
+
+async def run_vis(visexe, inpath, outpath):
+    # vis.html などはカレントディレクトリに書かれるので、実行ごとに作業ディレクトリを分ける
+    CACHEDIR.mkdir(parents=True, exist_ok=True)
+    work = Path(tempfile.mkdtemp(dir=CACHEDIR, prefix=".work"))
+    ret = await ahc_runner.run([Path(visexe).absolute(), Path(inpath).absolute(), Path(outpath).absolute()], stdout=work / SCORE, stderr=work / SCORE, cwd=work)
+    return ret, work
+
+
+def store(work, cachedir, names):
+    cachedir.mkdir(parents=True, exist_ok=True)
+    for name in names:
+        if (work / name).exists():
+            os.replace(work / name, cachedir / name)
+    shutil.rmtree(work, ignore_errors=True)
+
+
+async def score(visexe, inpath, outpath, otherpath):
+    # vis の出力を otherpath に足す、失敗したときはキャッシュしない
+    import asyncio
+    cachedir = CACHEDIR / await asyncio.to_thread(key, visexe, inpath, outpath)
+    if not (cachedir / SCORE).exists():
+        ret, work = await run_vis(visexe, inpath, outpath)
+        if ret != 0:
+            text = (work / SCORE).read_bytes()
+            shutil.rmtree(work, ignore_errors=True)
+            with open(otherpath, "ab") as f:
+                f.write(text)
+            return
+        # 描画の生成物は全シード分だと重いので、スコアだけ残す
+        store(work, cachedir, [SCORE])
+    with open(otherpath, "ab") as f:
+        f.write((cachedir / SCORE).read_bytes())
+
+
+async def render(visexe, inpath, outpath, destdir, name):
+    # 生成物を destdir/<name>.<拡張子> (複数あれば <name>_<ファイル名>) に置いて、そのパスを返す
+    cachedir = CACHEDIR / key(visexe, inpath, outpath)
+    renderdir = cachedir / RENDER
+    if not renderdir.exists():
+        ret, work = await run_vis(visexe, inpath, outpath)
+        if ret != 0:
+            shutil.rmtree(work, ignore_errors=True)
+            return []
+        # score.txt 以外はすべて描画の生成物
+        artifacts = Path(tempfile.mkdtemp(dir=CACHEDIR, prefix=".work"))
+        for p in work.iterdir():
+            if p.name != SCORE:
+                os.replace(p, artifacts / p.name)
+        store(work, cachedir, [SCORE])
+        os.replace(artifacts, renderdir)
+    files = sorted(renderdir.iterdir())
+    destdir = Path(destdir)
+    destdir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for f in files:
+        dest = destdir / (f"{name}{f.suffix}" if len(files) == 1 else f"{name}_{f.name}")
+        if f.is_dir():
+            shutil.copytree(f, dest, dirs_exist_ok=True)
+        else:
+            shutil.copy(f, dest)
+        paths.append(dest)
+    return paths
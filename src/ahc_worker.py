@@ -0,0 +1,294 @@
+"""
+ahctest のシードを複数のワーカ (別プロセス・別ホスト) に分けて流す
+
+python manage.py ahc024 rust test a --seeds=2000 --workers=4              (ローカルにワーカを 4 つ立てる)
+python manage.py ahc024 rust test a --seeds=2000 --listen=0.0.0.0:7000   (リモートのワーカを待つ)
+python src/ahc_worker.py <host>:7000 [--slots=8]                          (ワーカ側)
+
+接続するとまず実行ファイルと tools/in を 1 回だけ送り、あとはワーカが空きの数だけシードを取りに来る
+out / other / usage は結果が届くたびに書く、ワーカが落ちたら流していたシードはキューに戻して他のワーカに回す
+ワーカが 1 つも残っていなければ (ローカルのワーカが接続前に落ちた、リモートが全部切れた) 待っているシードをエラーにする
+認証キーは環境変数 AHC_WORKER_KEY (両側で同じにする)
+接続は pickle でやり取りするので、キーを知っていれば相手の側でコードを動かせる
+--workers だけならキーは毎回ランダムに作ってローカルのワーカに環境変数で渡す、--listen をループバック以外にするときは AHC_WORKER_KEY が必須
+"""
+import ipaddress
+import os
+import queue
+import secrets
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+
+try:
+    from src import exec_server
+except ImportError:
+    # リモートでは src/ahc_worker.py として直接起動される
+    import exec_server
+
+KEYENV = "AHC_WORKER_KEY"
+# 同じシードでワーカが落ちたらこの回数までやり直す
+RETRY = 3
+# ワーカが残っているかを見る間隔 (秒)
+WATCH = 0.5
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def make_bundle(argv, inputdir, seeds):
+    # argv のうち存在するファイルは中身を送り、ワーカの作業ディレクトリからの相対パスに置き換える
+    files = {}
+    command = []
+    for a in argv:
+        path = Path(a)
+        if path.is_file():
+            files[path.name] = path.read_bytes()
+            command.append("./" + path.name)
+        else:
+            command.append(a)
+    inputs = {seed: zlib.compress((Path(inputdir) / seed).read_bytes()) for seed in seeds}
+    return {"files": files, "argv": command, "inputs": inputs}
+
+
+class Remote:
+    # 1 つのワーカとの接続、送る側と受け取る側のスレッドで slots 個までシードを流しておく
+    def __init__(self, coordinator, conn, name):
+        self.coordinator = coordinator
+        self.conn = conn
+        self.name = name
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def start(self, bundle):
+        self.conn.send(("bundle", bundle))
+        _, slots = self.conn.recv()
+        self.credit = threading.Semaphore(slots)
+        threading.Thread(target=self.sender, daemon=True).start()
+        threading.Thread(target=self.receiver, daemon=True).start()
+        print(f"[worker] {self.name} connected ({slots} slots)")
+
+    def sender(self):
+        while not self.closed:
+            self.credit.acquire()
+            item = self.coordinator.take()
+            if item is None:
+                self.credit.release()
+                continue
+            seed, job, future = item
+            with self.lock:
+                if self.closed:
+                    self.coordinator.requeue(item)
+                    return
+                self.inflight[seed] = item
+            try:
+                self.conn.send(("seed", seed, job))
+            except (OSError, ValueError):
+                return
+
+    def receiver(self):
+        try:
+            while True:
+                _, seed, result = self.conn.recv()
+                with self.lock:
+                    item = self.inflight.pop(seed)
+                self.credit.release()
+                self.coordinator.finish(item, result)
+        except (EOFError, OSError):
+            pass
+        with self.lock:
+            self.closed = True
+            items = list(self.inflight.values())
+            self.inflight.clear()
+        if not self.coordinator.closing:
+            print(f"[worker] {self.name} disconnected, requeue {len(items)} seeds")
+        for item in items:
+            self.coordinator.requeue(item)
+        self.credit.release()
+
+    def close(self):
+        try:
+            self.conn.send(("stop",))
+        except (OSError, ValueError):
+            pass
+        self.conn.close()
+
+
+class Coordinator:
+    # test(seed, outdir, env) を ahctest の seed runner と同じ形で提供する
+    def __init__(self, argv, inputdir, seeds, address="127.0.0.1:0", workers=0, slots=None, timeout=None):
+        host, port = parse_address(address)
+        self.key = os.environ.get(KEYENV)
+        if self.key is None:
+            if not is_loopback(host):
+                raise Exception(f"listening on {host} needs {KEYENV} (the same key on every worker)")
+            self.key = secrets.token_bytes(32).hex()
+        self.bundle = make_bundle(argv, inputdir, seeds)
+        self.listener = Listener((host, port), authkey=self.key.encode())
+        self.workers = workers
+        self.slots = slots or max(1, (os.cpu_count() or 1) // max(1, workers))
+        self.queue = queue.Queue()
+        self.remotes = []
+        self.processes = []
+        self.retries = {}
+        self.timeout = timeout
+        self.loop = None
+        self.closing = False
+        self.error = None
+
+    def start(self, loop):
+        import subprocess
+        self.loop = loop
+        host, port = self.listener.address
+        print(f"[worker] listening on {host}:{port}")
+        threading.Thread(target=self.accept, daemon=True).start()
+        threading.Thread(target=self.watch, daemon=True).start()
+        for _ in range(self.workers):
+            env = {**os.environ, KEYENV: self.key}
+            self.processes.append(subprocess.Popen([sys.executable, __file__, f"{host}:{port}", f"--slots={self.slots}"], env=env))
+
+    def accept(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return
+            remote = Remote(self, conn, f"{self.listener.last_accepted[0]}#{len(self.remotes)}")
+            self.remotes.append(remote)
+            # バンドルの送信は重いので、他のワーカの接続を待たせない
+            threading.Thread(target=self.handshake, args=(remote,), daemon=True).start()
+
+    def handshake(self, remote):
+        try:
+            remote.start(self.bundle)
+        except (EOFError, OSError):
+            remote.closed = True
+
+    def watch(self):
+        # ワーカがいた (起動した・接続した) のに全部いなくなったら、キューに残ったシードを失敗させる
+        # --listen だけでまだ誰も接続していないときは待ち続ける
+        while True:
+            time.sleep(WATCH)
+            if self.closing:
+                return
+            started = self.processes or self.remotes
+            alive = any(p.poll() is None for p in self.processes) or any(not r.closed for r in self.remotes)
+            if started and not alive and self.error is None:
+                self.error = "no workers left (all local workers exited and no remote worker is connected)"
+                print(f"[worker] {self.error}")
+            if self.error is not None:
+                while True:
+                    try:
+                        _, _, future = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    self.loop.call_soon_threadsafe(self.fail, future)
+
+    def fail(self, future):
+        if not future.done():
+            future.set_exception(Exception(self.error))
+
+    def take(self):
+        try:
+            return self.queue.get(timeout=0.5)
+        except queue.Empty:
+            return None
+
+    def requeue(self, item):
+        seed, job, future = item
+        self.retries[seed] = self.retries.get(seed, 0) + 1
+        if self.retries[seed] > RETRY:
+            self.loop.call_soon_threadsafe(future.set_result, None)
+        else:
+            self.queue.put(item)
+
+    def finish(self, item, result):
+        seed, job, future = item
+        outdir = Path(job["outdir"])
+        (outdir / "out" / seed).write_bytes(exec_server.decode(result["stdout"]))
+        with open(outdir / "other" / seed, "ab") as f:
+            f.write(exec_server.decode(result["stderr"]))
+        if result.get("usage"):
+            (outdir / "usage" / seed).write_text(result["usage"])
+        self.loop.call_soon_threadsafe(future.set_result, result["returncode"])
+
+    async def test(self, seed, outdir, env=None):
+        if self.error is not None:
+            raise Exception(self.error)
+        future = self.loop.create_future()
+        self.queue.put((seed, {"outdir": str(outdir), "env": env, "timeout": self.timeout}, future))
+        return await future
+
+    def close(self):
+        self.closing = True
+        for remote in self.remotes:
+            remote.close()
+        self.listener.close()
+        for proc in self.processes:
+            proc.wait()
+
+
+def serve(address, slots):
+    # ワーカ側、バンドルを作業ディレクトリに展開してシードを受けては実行する
+    from concurrent.futures import ThreadPoolExecutor
+    conn = Client(parse_address(address), authkey=os.environ[KEYENV].encode())
+    _, bundle = conn.recv()
+    workdir = Path(tempfile.mkdtemp(prefix="ahc_worker_"))
+    try:
+        for name, data in bundle["files"].items():
+            (workdir / name).write_bytes(data)
+            (workdir / name).chmod(0o755)
+        (workdir / "in").mkdir()
+        for seed, data in bundle["inputs"].items():
+            (workdir / "in" / seed).write_bytes(zlib.decompress(data))
+        conn.send(("ready", slots))
+
+        lock = threading.Lock()
+
+        def run(seed, job):
+            result = exec_server.execute_blocking({"argv": bundle["argv"], "stdin": str(workdir / "in" / seed), "cwd": str(workdir), "env": job.get("env"), "timeout": job.get("timeout")})
+            with lock:
+                conn.send(("result", seed, result))
+
+        with ThreadPoolExecutor(slots) as executor:
+            while True:
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    break
+                if message[0] == "stop":
+                    break
+                _, seed, job = message
+                executor.submit(run, seed, job)
+    finally:
+        conn.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    options = dict(a[2:].partition("=")[::2] for a in sys.argv[1:] if a.startswith("--"))
+    if len(args) != 1:
+        print(__doc__)
+        sys.exit(1)
+    if KEYENV not in os.environ:
+        print(f"set {KEYENV} to the coordinator's key")
+        sys.exit(1)
+    serve(args[0], int(options.get("slots", os.cpu_count() or 1)))
@@ -0,0 +1,118 @@
+"""
+python / pypy / rust の実装を同じ入力で流して実行時間を比べる
+
+python manage.py abc301 bench a --repeat=5
+
+contest/<contest>/<task>.py と <task>.rs のうちあるものをすべてビルドして同時に流す
+サンプルごとに repeat 回流して run_time の median / p95 / max を出し、出力が揃っているかを見る
+最後に time_limit に一番近い実装を出す (pypy で間に合うか、rust に移すべきかの目安)
+AHC は tools/in の先頭のシードを使い、出力の一致は見ない
+"""
+import asyncio
+import shutil
+from pathlib import Path
+
+from src import ahc_analyze
+from src import ahc_runner
+from src import sample_runner
+
+WORKDIR = Path(".temp") / "bench"
+WIDTH = 24
+
+
+def percentile(values, p):
+    # 最近傍順位
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(p * len(values) + 0.5)) - 1))]
+
+
+def describe(values):
+    return percentile(values, 0.5), percentile(values, 0.95), max(values)
+
+
+async def run_variant(name, execute, samples, repeat, parallel, timeout):
+    # {sample: [(returncode, run_time)]}、出力は 1 回目のものを残す
+    workdir = WORKDIR / name
+    workdir.mkdir(parents=True, exist_ok=True)
+    results = {}
+
+    def job(sample, inpath, k):
+        suffix = "" if k == 0 else f".{k}"
+        return execute(inpath, workdir / f"{sample}.out{suffix}", workdir / f"{sample}.err", workdir / f"{sample}.usage{suffix}", timeout)
+
+    async def done(key, returncode, wall):
+        sample, k = key
+        usage = {}
+        path = workdir / (f"{sample}.usage" + ("" if k == 0 else f".{k}"))
+        if path.exists():
+            ahc_analyze.parse_file(path, usage)
+        results.setdefault(sample, []).append((returncode, usage.get("run_time", wall)))
+
+    jobs = [
+        ((sample, k), lambda sample=sample, inpath=inpath, k=k: job(sample, inpath, k))
+        for k in range(repeat) for sample, inpath, _ in samples
+    ]
+    await ahc_runner.run_all(jobs, parallel, None, on_done=done)
+    return results
+
+
+async def run(variants, samples, repeat, parallel, timeout):
+    # variants = {名前: execute}、すべての実装を同時に流す
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+    names = list(variants)
+    results = await asyncio.gather(*[run_variant(name, variants[name], samples, repeat, parallel[name], timeout) for name in names])
+    return dict(zip(names, results))
+
+
+def verdict(runs):
+    if any(r is None or r == sample_runner.TIMEOUT_EXIT for r, _ in runs):
+        return "TLE"
+    if any(r != 0 for r, _ in runs):
+        return "RE"
+    return ""
+
+
+def disagreements(results, samples, check, abs_tol=0.0, rel_tol=0.0):
+    # 期待出力があればそれと、無ければ最初の実装の出力と比べる
+    lines = []
+    names = list(results)
+    for sample, _, outpath in samples:
+        if not check:
+            break
+        if outpath is not None:
+            reference, label = outpath.read_bytes(), "expected"
+        else:
+            reference, label = (WORKDIR / names[0] / f"{sample}.out").read_bytes(), names[0]
+        for name in names:
+            path = WORKDIR / name / f"{sample}.out"
+            actual = path.read_bytes() if path.exists() else b""
+            ok, i = sample_runner.compare(reference, actual, abs_tol, rel_tol)
+            if not ok:
+                lines.append(f"{sample}: {name} differs from {label} at token {i} ({sample_runner.token(reference.split(), i)} vs {sample_runner.token(actual.split(), i)})")
+    return lines
+
+
+def report(results, samples, time_limit, check=True, abs_tol=0.0, rel_tol=0.0):
+    names = list(results)
+    print("sample".ljust(16) + "".join(f"{name} (median/p95/max)".rjust(WIDTH) for name in names))
+    worst = {}
+    for sample, _, _ in samples:
+        cells = []
+        for name in names:
+            runs = results[name].get(sample, [])
+            if not runs:
+                cells.append("-")
+                continue
+            median, p95, top = describe([t for _, t in runs])
+            worst[name] = max(worst.get(name, 0.0), top)
+            cells.append(f"{verdict(runs)} {median:.3f}/{p95:.3f}/{top:.3f}".strip())
+        print(sample[:15].ljust(16) + "".join(c.rjust(WIDTH) for c in cells))
+
+    for line in disagreements(results, samples, check, abs_tol, rel_tol):
+        print(line)
+    if worst:
+        name = max(worst, key=worst.get)
+        print(f"closest to TLE: {name} (max {worst[name]:.3f}s = {worst[name] / time_limit:.0%} of {time_limit}s)")
+        for n in names:
+            if n in worst:
+                print(f"  {n}: {worst[n] / time_limit:.0%}")
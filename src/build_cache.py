@@ -0,0 +1,91 @@
+import hashlib
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+from src import ahc_runner
+
+CACHEDIR = Path(".temp") / "build"
+
+
+def digest(paths, *extra):
+    h = hashlib.sha256()
+    for e in extra:
+        h.update(str(e).encode())
+        h.update(b"\0")
+    for path in sorted(Path(p) for p in paths):
+        h.update(str(path).encode())
+        h.update(b"\0")
+        h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+def manifest_text(cargopath):
+    # [[bin]] はタスクごとに書き換わるので、それ以外 (依存やプロファイル) だけをキーにする
+    lines = []
+    skip = False
+    with open(cargopath, "r") as f:
+        for line in f:
+            if line.startswith("["):
+                skip = line.strip() == "[[bin]]"
+            if not skip:
+                lines.append(line)
+    return "".join(lines)
+
+
+def solution_key(source_path, cargopath, profile="release"):
+    # ツールチェインはコンテナのイメージで決まる
+    return digest([source_path], manifest_text(cargopath), ahc_runner.compose_value("rust", "image"), profile)
+
+
+def host_toolchain():
+    try:
+        return subprocess.run(["rustc", "-V"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def tools_key(tools_dir, profile="release"):
+    tools_dir = Path(tools_dir)
+    sources = [p for p in (tools_dir / "src").rglob("*.rs")] + [tools_dir / "Cargo.toml"]
+    return digest(sources, host_toolchain(), profile)
+
+
+def lookup(name, key, cachedir=CACHEDIR):
+    binary = Path(cachedir) / name
+    stamp = Path(cachedir) / f"{name}.hash"
+    if binary.exists() and stamp.exists() and stamp.read_text() == key:
+        return binary
+    return None
+
+
+def store(name, key, built, cachedir=CACHEDIR):
+    cachedir = Path(cachedir)
+    cachedir.mkdir(parents=True, exist_ok=True)
+    binary = cachedir / name
+    tmp = cachedir / f".{name}.tmp"
+    shutil.copy2(built, tmp)
+    os.replace(tmp, binary)
+    (cachedir / f"{name}.hash").write_text(key)
+    return binary
+
+
+def build_tools(tools_dir, bins):
+    # tools (gen, vis, tester) をまとめてビルドする、ソースが変わっていなければ cargo を呼ばない
+    tools_dir = Path(tools_dir)
+    release = tools_dir / "target" / "release"
+    bins = [b for b in bins if (tools_dir / "src" / "bin" / f"{b}.rs").exists()]
+    if not bins:
+        return {}
+    key = tools_key(tools_dir)
+    stale = [b for b in bins if lookup(b, key, release) is None]
+    if stale:
+        command = ["cargo", "build", "--manifest-path", str(tools_dir / "Cargo.toml"), "--release"]
+        for b in stale:
+            command += ["--bin", b]
+        if subprocess.call(command) != 0:
+            raise Exception("tools build error")
+        for b in stale:
+            (release / f"{b}.hash").write_text(key)
+    return {b: release / b for b in bins}
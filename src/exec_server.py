@@ -0,0 +1,236 @@
+"""
+コンテナ内に常駐して実行ジョブを受け付けるサーバ
+
+python src/exec_server.py serve .temp/python.sock     (コンテナ内で起動)
+
+ジョブは 1 行の JSON で送り、結果も 1 行の JSON で返す
+  {"argv": [...], "stdin": path, "input": str, "stdout": path, "stderr": path, "append": bool, "timeout": float}
+  -> {"returncode": int | None, "stdout": str, "stderr": str, "time": float, "cpu_time": float, "maxrss_mb": float, "usage": str}
+"usage": path を付けると measure.py と同じ形式で CPU 時間・メモリをそこにも書く
+パスはどちらも /workspace (= リポジトリのルート) からの相対パスで扱う
+"""
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    from src import measure
+except ImportError:
+    # コンテナ内では src/exec_server.py として直接起動される
+    import measure
+
+SOCKETDIR = ".temp"
+LIMIT = 1 << 30
+EXECUTOR = ThreadPoolExecutor(64)
+
+# サービスごとにサーバを動かす python
+SERVICE_PYTHON = {
+    "python": "python",
+    "pypy": "pypy3",
+    "rust": "python3",
+}
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def socket_path(service):
+    path = ROOT / SOCKETDIR / f"{service}.sock"
+    # unix socket のパス長制限を避けるため、短ければ相対パスにする
+    rel = os.path.relpath(path)
+    return rel if len(rel) < len(str(path)) else str(path)
+
+
+def encode(data):
+    return data.decode("latin-1") if data is not None else None
+
+
+def decode(text):
+    return text.encode("latin-1") if text is not None else b""
+
+
+def execute_blocking(job):
+    # wait4 で CPU 時間と最大メモリも取るので、asyncio ではなくスレッドで待つ
+    files = []
+    try:
+        data = None
+        if job.get("stdin") is not None:
+            fin = open(job["stdin"], "rb")
+            files.append(fin)
+        elif job.get("input") is not None:
+            fin = subprocess.PIPE
+            data = decode(job["input"])
+        else:
+            fin = subprocess.DEVNULL
+        if job.get("stdout") is not None:
+            fout = open(job["stdout"], "ab" if job.get("append") else "wb")
+            files.append(fout)
+        else:
+            fout = subprocess.PIPE
+        if job.get("stderr") is not None and job.get("stderr") == job.get("stdout"):
+            ferr = fout
+        elif job.get("stderr") is not None:
+            ferr = open(job["stderr"], "ab")
+            files.append(ferr)
+        else:
+            ferr = subprocess.PIPE
+
+        start = time.perf_counter()
+        # tester や broker の子 (解答) も一緒に止められるよう、ジョブごとにプロセスグループを分ける
+        proc = subprocess.Popen(
+            job["argv"], stdin=fin, stdout=fout, stderr=ferr, cwd=job.get("cwd"),
+            env={**os.environ, **job["env"]} if job.get("env") is not None else None, start_new_session=True,
+        )
+        killed = []
+
+        def kill():
+            # 直接の子だけを殺すと孫がパイプを持ったまま残り、drain が終わらない (GNU timeout と同じくグループごと)
+            killed.append(True)
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+        timer = threading.Timer(job["timeout"], kill) if job.get("timeout") else None
+        if timer is not None:
+            timer.start()
+
+        outputs = {}
+        threads = []
+
+        def feed():
+            try:
+                proc.stdin.write(data)
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+        def drain(name, stream):
+            outputs[name] = stream.read()
+            stream.close()
+
+        if data is not None:
+            threads.append(threading.Thread(target=feed))
+        if fout is subprocess.PIPE:
+            threads.append(threading.Thread(target=drain, args=("stdout", proc.stdout)))
+        if ferr is subprocess.PIPE:
+            threads.append(threading.Thread(target=drain, args=("stderr", proc.stderr)))
+        for t in threads:
+            t.start()
+        _, status, rusage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        for t in threads:
+            t.join()
+        if timer is not None:
+            timer.cancel()
+
+        usage = measure.usage_lines(wall, rusage)
+        if job.get("usage") is not None:
+            measure.write_usage(job["usage"], usage)
+        return {
+            "returncode": None if killed else proc.returncode,
+            "stdout": encode(outputs.get("stdout")),
+            "stderr": encode(outputs.get("stderr")),
+            "time": wall,
+            "cpu_time": rusage.ru_utime + rusage.ru_stime,
+            "maxrss_mb": rusage.ru_maxrss / 1024,
+            "usage": usage,
+        }
+    except OSError as e:
+        return {"returncode": 127, "stdout": None, "stderr": str(e), "time": 0.0}
+    finally:
+        for f in files:
+            f.close()
+
+
+async def execute(job):
+    return await asyncio.get_running_loop().run_in_executor(EXECUTOR, execute_blocking, job)
+
+
+async def handle(reader, writer):
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            result = await execute(json.loads(line))
+            writer.write(json.dumps(result).encode() + b"\n")
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(path):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(handle, path, limit=LIMIT)
+    # ホスト側のユーザからも繋げるように
+    os.chmod(path, 0o777)
+    async with server:
+        await server.serve_forever()
+
+
+async def request(service, job):
+    reader, writer = await asyncio.open_unix_connection(socket_path(service), limit=LIMIT)
+    try:
+        writer.write(json.dumps(job).encode() + b"\n")
+        await writer.drain()
+        return json.loads(await reader.readline())
+    finally:
+        writer.close()
+
+
+async def ping(service):
+    try:
+        result = await request(service, {"argv": ["true"]})
+        return result["returncode"] == 0
+    except (OSError, ValueError):
+        return False
+
+
+async def ensure(service, wait=10):
+    # サーバが居なければコンテナ内で起動する
+    if await ping(service):
+        return
+    command = ["docker", "compose", "exec", "-d", service, SERVICE_PYTHON[service], "src/exec_server.py", "serve", f"{SOCKETDIR}/{service}.sock"]
+    proc = await asyncio.create_subprocess_exec(*command)
+    await proc.wait()
+    start = time.perf_counter()
+    while time.perf_counter() - start < wait:
+        if await ping(service):
+            return
+        await asyncio.sleep(0.1)
+    raise Exception(f"exec server ({service}) not started")
+
+
+async def run(service, argv, stdin=None, stdout=None, stderr=None, timeout=None, append=False, cwd=None, env=None, usage=None):
+    # ahc_runner.run と同じ形で呼べるようにしたもの
+    job = {
+        "argv": [str(a) for a in argv],
+        "stdin": str(stdin) if stdin is not None else None,
+        "stdout": str(stdout) if stdout is not None else None,
+        "stderr": str(stderr) if stderr is not None else None,
+        "append": append,
+        "timeout": timeout,
+        "cwd": str(cwd) if cwd is not None else None,
+        "env": env,
+        "usage": str(usage) if usage is not None else None,
+    }
+    result = await request(service, job)
+    return result["returncode"]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "serve":
+        asyncio.run(serve(sys.argv[2]))
+    else:
+        print(__doc__)
+        sys.exit(1)
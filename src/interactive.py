@@ -0,0 +1,165 @@
+"""
+インタラクティブ問題のジャッジと解答をパイプで直接つなぐ (シェルも docker compose exec の行ごとの往復も挟まない)
+
+python src/interactive.py broker <judge...> -- <solution...>   (ABC: ジャッジと解答を両方起動する)
+python src/interactive.py relay -- <solution...>               (AHC: tester の子として動き、tester と解答の間を中継する)
+
+broker では標準入力 (テストケース) を一時ファイルに書き、そのパスをジャッジの最後の引数に渡す
+ジャッジの標準エラーはそのまま流す、終了コードはジャッジが 0 以外ならそれ、次に解答が 0 以外ならそれ
+どちらも 64KB ずつまとめて中継し、次の値を環境変数 INTERACTIVE_STATS のファイルに追記する (無ければ標準エラー)
+  queries       : 解答からジャッジへの行数
+  responses     : ジャッジから解答への行数
+  judge_time    : ジャッジの出力を待っていた時間 (秒)
+  solution_time : 解答の出力を待っていた時間 (秒)
+  judge_cpu / solution_cpu : それぞれの CPU 時間 (relay ではジャッジの分は取れない)
+"""
+import os
+import selectors
+import subprocess
+import sys
+import tempfile
+import time
+
+CHUNK = 1 << 16
+
+
+class Pipe:
+    # src から読んで dst に書く一方向の中継、書けない分はためておく
+    def __init__(self, name, src, dst):
+        self.name = name
+        self.src = src
+        self.dst = dst
+        self.pending = b""
+        self.lines = 0
+        self.time = 0.0
+        self.eof = False
+        os.set_blocking(dst, False)
+
+    def close_dst(self):
+        if self.dst is not None:
+            os.close(self.dst)
+            self.dst = None
+
+
+def pump(pipes):
+    # 両方向を selectors で中継する、ある側から出力が来たら前のイベントからの時間をその側に付ける
+    selector = selectors.DefaultSelector()
+    for pipe in pipes:
+        selector.register(pipe.src, selectors.EVENT_READ, pipe)
+    last = time.perf_counter()
+    while selector.get_map():
+        for key, events in selector.select():
+            pipe, fd = key.data, key.fd
+            if fd == pipe.src:
+                data = os.read(fd, CHUNK)
+                now = time.perf_counter()
+                pipe.time += now - last
+                last = now
+                if not data:
+                    selector.unregister(fd)
+                    pipe.eof = True
+                    if not pipe.pending:
+                        pipe.close_dst()
+                    continue
+                pipe.lines += data.count(b"\n")
+                if pipe.dst is None:
+                    continue
+                pipe.pending += data
+            if pipe.dst is None:
+                continue
+            try:
+                n = os.write(pipe.dst, pipe.pending)
+                pipe.pending = pipe.pending[n:]
+            except BlockingIOError:
+                pass
+            except BrokenPipeError:
+                # 読む側が終わった、残りは捨てる
+                pipe.pending = b""
+                if pipe.dst in selector.get_map():
+                    selector.unregister(pipe.dst)
+                pipe.close_dst()
+                continue
+            # 書き残しがあれば書けるようになるのを待つ
+            registered = pipe.dst in selector.get_map()
+            if pipe.pending and not registered:
+                selector.register(pipe.dst, selectors.EVENT_WRITE, pipe)
+            elif not pipe.pending and registered:
+                selector.unregister(pipe.dst)
+            if not pipe.pending and pipe.eof:
+                pipe.close_dst()
+    selector.close()
+
+
+def spawn(argv):
+    # パイプは自分で作って fd のまま扱う (Popen のファイルオブジェクトのバッファを通さない)
+    # os.pipe は継承されないので、もう一方の子にこちらの端が漏れて EOF が来なくなることはない
+    rin, win = os.pipe()
+    rout, wout = os.pipe()
+    proc = subprocess.Popen(argv, stdin=rin, stdout=wout)
+    os.close(rin)
+    os.close(wout)
+    return proc, win, rout
+
+
+def wait(proc):
+    # (終了コード, CPU 時間)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, rusage.ru_utime + rusage.ru_stime
+
+
+def write_stats(stats):
+    text = "".join(f"{k} = {v:.3f}\n" if isinstance(v, float) else f"{k} = {v}\n" for k, v in stats.items())
+    path = os.environ.get("INTERACTIVE_STATS")
+    if path:
+        with open(path, "a") as f:
+            f.write(text)
+    else:
+        sys.stderr.write(text)
+
+
+def broker(judge, solution):
+    with tempfile.NamedTemporaryFile(prefix="case") as case:
+        case.write(sys.stdin.buffer.read())
+        case.flush()
+        jp, jin, jout = spawn(judge + [case.name])
+        sp, sin, sout = spawn(solution)
+        query = Pipe("solution", sout, jin)
+        response = Pipe("judge", jout, sin)
+        pump([query, response])
+        jret, jcpu = wait(jp)
+        sret, scpu = wait(sp)
+    write_stats({
+        "queries": query.lines, "responses": response.lines,
+        "judge_time": response.time, "solution_time": query.time,
+        "judge_cpu": jcpu, "solution_cpu": scpu,
+    })
+    return jret or sret
+
+
+def relay(solution):
+    sp, sin, sout = spawn(solution)
+    query = Pipe("solution", sout, os.dup(1))
+    response = Pipe("judge", 0, sin)
+    pump([query, response])
+    sret, scpu = wait(sp)
+    write_stats({
+        "queries": query.lines, "responses": response.lines,
+        "judge_time": response.time, "solution_time": query.time,
+        "solution_cpu": scpu,
+    })
+    return sret
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if len(args) < 3 or args[0] not in ("broker", "relay") or "--" not in args:
+        print(__doc__)
+        sys.exit(1)
+    i = args.index("--")
+    if args[0] == "broker" and i > 1:
+        sys.exit(broker(args[1:i], args[i + 1:]))
+    elif args[0] == "relay" and i == 1:
+        sys.exit(relay(args[i + 1:]))
+    print(__doc__)
+    sys.exit(1)
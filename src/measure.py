@@ -0,0 +1,57 @@
+"""
+コマンドを実行して CPU 時間・実時間・最大メモリを記録する (コンテナ内で使う)
+
+python src/measure.py <usage path | -> -- command...
+
+usage には ahc_analyze が読める "key = value" 形式で書く
+"""
+import os
+import subprocess
+import sys
+import time
+
+KEYS = ["run_time", "cpu_time", "user_time", "sys_time", "maxrss_mb"]
+
+
+def usage_lines(wall, rusage):
+    # ru_maxrss は Linux では KB
+    values = {
+        "run_time": wall,
+        "cpu_time": rusage.ru_utime + rusage.ru_stime,
+        "user_time": rusage.ru_utime,
+        "sys_time": rusage.ru_stime,
+        "maxrss_mb": rusage.ru_maxrss / 1024,
+    }
+    return "".join(f"{k} = {values[k]:.3f}\n" for k in KEYS)
+
+
+def write_usage(path, text):
+    if path == "-":
+        sys.stderr.write(text)
+        sys.stderr.flush()
+        return
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def measure(argv, **kwargs):
+    # (returncode, wall, rusage)、stdin/stdout/stderr は Popen にそのまま渡す
+    start = time.perf_counter()
+    proc = subprocess.Popen(argv, **kwargs)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, wall, rusage
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    path = sys.argv[1]
+    argv = sys.argv[2:]
+    if argv[0] == "--":
+        argv = argv[1:]
+    returncode, wall, rusage = measure(argv)
+    write_usage(path, usage_lines(wall, rusage))
+    sys.exit(returncode if returncode >= 0 else 128 - returncode)
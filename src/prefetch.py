@@ -0,0 +1,197 @@
+"""
+コンテストの全タスクの問題ページ・サンプル・AHC のローカル版ツールをまとめて取ってくる
+
+python manage.py ahc024 prefetch            (タスク一覧から全タスク)
+python manage.py abc301 prefetch a b c
+python manage.py abc301 prefetch --base_url=http://127.0.0.1:8000   (ローカルの代わりのサーバで試す)
+
+1 つの requests.Session を使い回してタスクごとに並列で取る
+ダウンロードは .temp/download/ に .part で書いてから置き換え、途中で切れたら Range で続きから取る
+URL と ETag を覚えておき、次からは If-None-Match で 304 ならキャッシュを使う (ツールの展開もしない)
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import zipfile
+from pathlib import Path
+
+BASE_URL = "https://atcoder.jp"
+CACHEDIR = Path(".temp") / "download"
+INDEX = "index.json"
+CHUNK = 1 << 16
+TIMEOUT = 30
+# 展開したツールがどの zip から来たか
+STAMP = ".prefetch"
+
+index_lock = threading.Lock()
+
+
+def task_url(base_url, contest, task):
+    return f"{base_url}/contests/{contest}/tasks/{contest}_{task}"
+
+
+def session(parallel):
+    import requests
+    from requests.adapters import HTTPAdapter
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=parallel, pool_maxsize=parallel)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    from src import ahc_download_tools
+    if os.path.exists(ahc_download_tools.COOKIEPATH):
+        s.cookies.update(ahc_download_tools.load_lwp_cookies(ahc_download_tools.COOKIEPATH))
+    return s
+
+
+def load_index():
+    path = CACHEDIR / INDEX
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def update_index(url, etag):
+    with index_lock:
+        index = load_index()
+        if etag:
+            index[url] = etag
+        else:
+            index.pop(url, None)
+        tmp = CACHEDIR / ("." + INDEX)
+        tmp.write_text(json.dumps(index, indent=1))
+        os.replace(tmp, CACHEDIR / INDEX)
+
+
+def fetch(s, url):
+    # (キャッシュのパス, 変わったか) を返す
+    CACHEDIR.mkdir(parents=True, exist_ok=True)
+    name = hashlib.sha256(url.encode()).hexdigest()[:16]
+    path = CACHEDIR / name
+    part = CACHEDIR / (name + ".part")
+    partetag = CACHEDIR / (name + ".part.etag")
+    etag = load_index().get(url)
+    headers = {}
+    if etag and path.exists():
+        headers["If-None-Match"] = etag
+    elif part.exists() and partetag.exists():
+        # 途中まで取ったものと同じ中身 (ETag) なら続きだけ返してもらう
+        headers["Range"] = f"bytes={part.stat().st_size}-"
+        headers["If-Range"] = partetag.read_text()
+
+    with s.get(url, headers=headers, stream=True, timeout=TIMEOUT) as r:
+        if r.status_code == 304:
+            return path, False
+        r.raise_for_status()
+        etag = r.headers.get("ETag")
+        if etag:
+            partetag.write_text(etag)
+        with open(part, "ab" if r.status_code == 206 else "wb") as f:
+            for chunk in r.iter_content(CHUNK):
+                f.write(chunk)
+    os.replace(part, path)
+    if partetag.exists():
+        partetag.unlink()
+    update_index(url, etag)
+    return path, True
+
+
+def list_tasks(s, base_url, contest):
+    import bs4
+    path, _ = fetch(s, f"{base_url}/contests/{contest}/tasks")
+    html = bs4.BeautifulSoup(path.read_bytes(), "html.parser")
+    tasks = []
+    for a in html.find_all("a", href=True):
+        m = re.search(rf"/contests/{re.escape(contest)}/tasks/{re.escape(contest)}_(\w+)$", a["href"])
+        if m and m.group(1) not in tasks:
+            tasks.append(m.group(1))
+    return tasks
+
+
+def parse_samples(html):
+    # 「入力例 k」「出力例 k」の見出しの後ろの <pre> (日本語の方だけ)
+    samples = {}
+    for h3 in html.find_all("h3"):
+        m = re.match(r"(入力例|出力例)\s*(\d+)", h3.get_text().strip())
+        pre = h3.find_next_sibling("pre")
+        if m is None or pre is None:
+            continue
+        kind = "in" if m.group(1) == "入力例" else "out"
+        samples.setdefault(int(m.group(2)), {}).setdefault(kind, pre.get_text().lstrip("\r\n"))
+    return samples
+
+
+def link(html, base, text):
+    import requests
+    a = html.find("a", string=lambda x: x and text in x)
+    return requests.compat.urljoin(base, a["href"]) if a is not None else None
+
+
+def extract_tools(zippath, toolsdir, stamp):
+    # zip の中の先頭の tools/ を外して toolsdir に展開する、同じ zip から展開済みなら何もしない
+    toolsdir = Path(toolsdir)
+    if (toolsdir / STAMP).exists() and (toolsdir / STAMP).read_text() == stamp:
+        return False
+    tmp = toolsdir.with_name(toolsdir.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    with zipfile.ZipFile(zippath) as z:
+        members = [m for m in z.infolist() if not m.is_dir()]
+        tops = {m.filename.split("/")[0] for m in members}
+        strip = len(tops) == 1 and all("/" in m.filename for m in members)
+        for m in members:
+            dest = tmp / (m.filename.split("/", 1)[1] if strip else m.filename)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            with z.open(m) as src, open(dest, "wb") as f:
+                shutil.copyfileobj(src, f, CHUNK)
+    (tmp / STAMP).write_text(stamp)
+    shutil.rmtree(toolsdir, ignore_errors=True)
+    os.replace(tmp, toolsdir)
+    return True
+
+
+def prefetch_task(s, base_url, contest, task, taskdir, ahc):
+    # 1 タスク分、何をしたかを 1 行で返す
+    import bs4
+    url = task_url(base_url, contest, task)
+    path, _ = fetch(s, url)
+    html = bs4.BeautifulSoup(path.read_bytes(), "html.parser")
+    taskdir = Path(taskdir)
+    testdir = taskdir / "test"
+    testdir.mkdir(parents=True, exist_ok=True)
+    samples = parse_samples(html)
+    for k, sample in samples.items():
+        for kind, text in sample.items():
+            (testdir / f"sample-{k}.{kind}").write_text(text)
+    done = [f"{len(samples)} samples"]
+
+    if ahc:
+        zipurl = link(html, url, "ローカル版")
+        if zipurl is None:
+            done.append("tools not found")
+        else:
+            zippath, _ = fetch(s, zipurl)
+            stamp = f"{zipurl} {load_index().get(zipurl) or zippath.stat().st_mtime_ns}"
+            done.append("tools extracted" if extract_tools(zippath, taskdir / "tools", stamp) else "tools cached")
+        webvis = link(html, url, "Web版")
+        if webvis is not None:
+            (taskdir / "webvis").write_text(webvis)
+    return ", ".join(done)
+
+
+def main(contest, tasks, resourcedir, base_url=BASE_URL, parallel=8):
+    # resourcedir/<task> に test/ (と AHC なら tools/, webvis) を置く
+    from concurrent.futures import ThreadPoolExecutor
+    s = session(parallel)
+    if not tasks:
+        tasks = list_tasks(s, base_url, contest)
+    ahc = "ahc" in contest
+    with ThreadPoolExecutor(parallel) as executor:
+        futures = {task: executor.submit(prefetch_task, s, base_url, contest, task, Path(resourcedir) / task, ahc) for task in tasks}
+        ok = True
+        for task, future in futures.items():
+            try:
+                print(f"{task}: {future.result()}")
+            except Exception as e:
+                ok = False
+                print(f"{task}: failed ({e})")
+    return ok
@@ -0,0 +1,86 @@
+"""
+python / pypy の解答をサンプリングしてスタックを collapsed 形式 (flamegraph.pl / speedscope が読める) で書く
+
+python src/profiler.py <out.folded> -- solution.py   (コンテナ内で使う、標準入出力はそのまま)
+python src/profiler.py -- solution.py                (出力先は環境変数 PROFILE_OUT、シードごとに変えるとき)
+
+CPU 時間で INTERVAL ごとにスタックを取り、"関数 (ファイル);...;関数 (ファイル:行) 回数" の行にする
+末尾のフレームだけ行番号を付けるので、行ごとのホットスポットも同じファイルから出せる
+"""
+import os
+import signal
+import sys
+from collections import Counter
+
+INTERVAL = 0.001
+# 自分と runpy のフレームは数えない
+SKIP = ("profiler.py", "runpy.py", "<frozen runpy>")
+
+
+def frame_name(frame, line=False):
+    code = frame.f_code
+    name = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({name}:{frame.f_lineno})" if line else f"{code.co_name} ({name})"
+
+
+def collapse(frame):
+    stack = []
+    leaf = True
+    while frame is not None:
+        if os.path.basename(frame.f_code.co_filename) not in SKIP:
+            stack.append(frame_name(frame, line=leaf))
+            leaf = False
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+def run(out, argv):
+    import runpy
+    counts = Counter()
+
+    def sample(signum, frame):
+        stack = collapse(frame)
+        if stack:
+            counts[stack] += 1
+
+    sys.argv = argv
+    sys.path[0] = os.path.dirname(os.path.abspath(argv[0]))
+    signal.signal(signal.SIGPROF, sample)
+    signal.setitimer(signal.ITIMER_PROF, INTERVAL, INTERVAL)
+    try:
+        runpy.run_path(argv[0], run_name="__main__")
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        sys.stdout.flush()
+        with open(out, "w") as f:
+            for stack, count in counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def load(path, counts=None):
+    # collapsed の行を足していく
+    counts = counts if counts is not None else Counter()
+    with open(path) as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack:
+                counts[stack] += int(count)
+    return counts
+
+
+def hot_spots(counts, k=20):
+    # 行ごとの (割合, 末尾のフレーム) を多い順に
+    lines = Counter()
+    for stack, count in counts.items():
+        lines[stack.rpartition(";")[2]] += count
+    total = sum(lines.values()) or 1
+    return [(count / total, leaf) for leaf, count in lines.most_common(k)]
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    out = args.pop(0) if args and args[0] != "--" else os.environ.get("PROFILE_OUT")
+    if out is None or len(args) < 2 or args[0] != "--":
+        print(__doc__)
+        sys.exit(1)
+    run(out, args[1:])
@@ -0,0 +1,131 @@
+import re
+import shutil
+from pathlib import Path
+
+from src import ahc_analyze
+from src import ahc_runner
+
+WORKDIR = Path(".temp") / "samples"
+# コンテナ内の timeout コマンドが切ったときの終了コード
+TIMEOUT_EXIT = 124
+
+
+def natural_key(path):
+    return [int(t) if t.isdigit() else t for t in re.split(r"(\d+)", Path(path).name)]
+
+
+def discover(test_dir):
+    # oj download が置く test/*.in と対応する *.out
+    test_dir = Path(test_dir)
+    samples = []
+    for inpath in sorted(test_dir.glob("*.in"), key=natural_key):
+        outpath = inpath.with_suffix(".out")
+        samples.append((inpath.stem, inpath, outpath if outpath.exists() else None))
+    return samples
+
+
+def is_float(token):
+    try:
+        float(token)
+        return True
+    except ValueError:
+        return False
+
+
+def compare(expected, actual, abs_tol=0.0, rel_tol=0.0):
+    # 空白区切りのトークンごとに比べる、許容誤差があれば数値として比べる
+    # (一致したか, 最初に違ったトークンの位置)
+    a = expected.split()
+    b = actual.split()
+    for i, (x, y) in enumerate(zip(a, b)):
+        if x == y:
+            continue
+        if (abs_tol or rel_tol) and is_float(x) and is_float(y):
+            fx, fy = float(x), float(y)
+            if abs(fx - fy) <= max(abs_tol, rel_tol * abs(fx)):
+                continue
+        return False, i
+    if len(a) != len(b):
+        return False, min(len(a), len(b))
+    return True, None
+
+
+def token(tokens, i):
+    return tokens[i].decode(errors="replace") if i < len(tokens) else "(EOF)"
+
+
+async def run(samples, execute, parallel, timeout, abs_tol=0.0, rel_tol=0.0, first_failure=False, first=None, interactive=False):
+    # execute(stdin, stdout, stderr, usage, timeout) は returncode (タイムアウトなら None) を返すコルーチン
+    # interactive=True なら src/interactive.py broker の終了コード (ジャッジの判定) で決め、出力は比べない
+    # first に名前を渡すとそのサンプルだけを先に流して、結果が出てから残りを流す
+    # 戻り値 = {name: (verdict, 詳細, usage)}
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+    WORKDIR.mkdir(parents=True, exist_ok=True)
+    verdicts = {}
+
+    async def done(name, returncode, wall):
+        _, inpath, outpath = next(s for s in samples if s[0] == name)
+        output = {}
+        if (WORKDIR / f"{name}.usage").exists():
+            ahc_analyze.parse_file(WORKDIR / f"{name}.usage", output)
+        actual = (WORKDIR / f"{name}.out").read_bytes() if (WORKDIR / f"{name}.out").exists() else b""
+        if returncode is None or returncode == TIMEOUT_EXIT:
+            verdict, detail = "TLE", ""
+        elif interactive:
+            # broker の統計 (queries = ...) はジャッジの標準エラーと一緒に .err に出ている
+            if (WORKDIR / f"{name}.err").exists():
+                ahc_analyze.parse_file(WORKDIR / f"{name}.err", output)
+            verdict = "AC" if returncode == 0 else "WA"
+            detail = f"{int(output.get('queries', 0))} queries" + ("" if returncode == 0 else f", exit code {returncode}")
+        elif returncode != 0:
+            verdict, detail = "RE", f"exit code {returncode}"
+        elif outpath is None:
+            verdict, detail = "--", "no expected output"
+        else:
+            expected = outpath.read_bytes()
+            ok, i = compare(expected, actual, abs_tol, rel_tol)
+            verdict = "AC" if ok else "WA"
+            detail = "" if ok else f"token {i}: expected {token(expected.split(), i)}, got {token(actual.split(), i)}"
+        verdicts[name] = (verdict, detail, output)
+        return first_failure and verdict not in ("AC", "--")
+
+    def job(name, inpath):
+        return execute(inpath, WORKDIR / f"{name}.out", WORKDIR / f"{name}.err", WORKDIR / f"{name}.usage", timeout)
+
+    jobs = [(name, lambda name=name, inpath=inpath: job(name, inpath)) for name, inpath, _ in samples]
+    head = [j for j in jobs if j[0] == first]
+    if head:
+        await ahc_runner.run_all(head, 1, None, on_done=done)
+        verdict = verdicts[first][0]
+        print(f"[{verdict}] {first} (last failed)")
+        if first_failure and verdict not in ("AC", "--"):
+            return verdicts
+    await ahc_runner.run_all([j for j in jobs if j[0] != first], parallel, None, on_done=done)
+    return verdicts
+
+
+def first_failed(samples, verdicts):
+    for name, _, _ in samples:
+        if name in verdicts and verdicts[name][0] not in ("AC", "--"):
+            return name
+    return None
+
+
+def report(samples, verdicts):
+    # サンプル順に結果を出す、通ったら True
+    for name, _, _ in samples:
+        if name not in verdicts:
+            print(f"[--] {name} skipped")
+            continue
+        verdict, detail, output = verdicts[name]
+        usage = ""
+        if "run_time" in output:
+            usage = f" {output['run_time']:.3f}s {output.get('maxrss_mb', 0.0):.1f}MB"
+        print(f"[{verdict}] {name}{usage} {detail}".rstrip())
+        if verdict not in ("AC", "--"):
+            err = WORKDIR / f"{name}.err"
+            if err.exists() and err.stat().st_size:
+                print(err.read_text(errors="replace")[:2000].rstrip())
+    ok = sum(1 for v, _, _ in verdicts.values() if v == "AC")
+    print(f"AC {ok}/{len(samples)}")
+    return len(verdicts) == len(samples) and all(v in ("AC", "--") for v, _, _ in verdicts.values())
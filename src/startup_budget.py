@@ -0,0 +1,77 @@
+"""
+manage.py の起動時間の予算チェック
+
+python src/startup_budget.py
+
+python -X importtime で manage.py を (何もしないコマンドで) 起動し、
+素の python の起動に比べて増えた import の時間が BUDGET_MS を超えるか、
+FORBIDDEN のモジュールが import されていたら失敗する
+"""
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+BUDGET_MS = 30
+RUNS = 5
+# コマンドを実行するまでは読み込まないはずのもの
+FORBIDDEN = ["asyncio", "toml", "webbrowser", "requests", "bs4", "pandas", "numpy", "src.ahc_analyze", "src.ahc_download_tools"]
+
+
+def importtime(argv):
+    # {モジュール名: cumulative us} (トップレベルの import だけ)
+    result = subprocess.run([sys.executable, "-X", "importtime"] + argv, cwd=ROOT, capture_output=True, text=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line.split("|")
+        try:
+            cumulative = int(parts[1])
+        except ValueError:
+            continue
+        name = parts[2]
+        # ネストした import は名前の前の空白が深くなる
+        if name.startswith("  "):
+            modules.setdefault(name.strip(), 0)
+            continue
+        modules[name.strip()] = cumulative
+    return modules
+
+
+def wall(argv):
+    best = None
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + argv, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    # 何にも当たらない引数で起動する (ディスパッチまでの時間だけを測る)
+    argv = ["manage.py", "abc000", "startup-budget", "x"]
+    baseline = importtime(["-c", "pass"])
+    modules = importtime(argv)
+    extra = {k: v for k, v in modules.items() if k not in baseline}
+    total_ms = sum(extra.values()) / 1000
+
+    print(f"imports: {total_ms:.1f}ms (budget {BUDGET_MS}ms)")
+    for name, us in sorted(extra.items(), key=lambda x: -x[1])[:10]:
+        if us:
+            print(f"  {name}: {us / 1000:.1f}ms")
+    print(f"wall: manage.py {wall(argv) * 1000:.1f}ms, python -c pass {wall(['-c', 'pass']) * 1000:.1f}ms")
+
+    forbidden = [m for m in FORBIDDEN if m in modules]
+    if forbidden:
+        print(f"forbidden imports at startup: {', '.join(forbidden)}")
+    return 1 if forbidden or total_ms > BUDGET_MS else 0
+
+
+if __name__ == "__main__":
+    os.chdir(ROOT)
+    sys.exit(main())
@@ -0,0 +1,255 @@
+"""
+ランダムなケースで解答と愚直解を比べ、食い違ったら入力を小さくしてテストケースに加える
+
+python manage.py abc301 python make_samples a 100000
+
+contest/<contest>/<task>_gen.py   : 入力を標準出力に書く (sys.argv[1] = seed、sys.argv[2] = サイズの目安、random は seed で初期化済み)
+contest/<contest>/<task>_naive.py : 愚直解
+python の解答・生成器・愚直解はプロセスプールの中で一度だけコンパイルして使い回す (起動のコストがかからない)
+rust の解答はビルドしたバイナリをホストで直接動かす
+食い違ったら、まずサイズの目安を下げて探し直し、次に行を削る (ddmin)
+数だけを書き換えると N と要素数が合わない入力になりやすいので、値の大きさはサイズの目安で小さくする
+愚直解が落ちる入力は不正な入力として扱い、縮めた結果には使わない
+"""
+import io
+import math
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from src import sample_runner
+
+BATCH = 64
+# 縮めるときに試す回数の上限
+SHRINK_LIMIT = 2000
+SIZE_TRIES = 200
+
+state = {}
+
+
+class Timeout(Exception):
+    pass
+
+
+def alarm(signum, frame):
+    raise Timeout()
+
+
+def init(gen, naive, solution, timeout, abs_tol, rel_tol):
+    # solution = ("python", path) | ("exec", argv)
+    state["gen"] = (gen, compile(Path(gen).read_text(), gen, "exec"))
+    state["naive"] = (naive, compile(Path(naive).read_text(), naive, "exec"))
+    if solution[0] == "python":
+        state["solution"] = (solution[1], compile(Path(solution[1]).read_text(), solution[1], "exec"))
+    else:
+        state["solution"] = solution[1]
+    state["timeout"] = timeout
+    state["tol"] = (abs_tol, rel_tol)
+    signal.signal(signal.SIGALRM, alarm)
+
+
+def feed(data):
+    # open(0) で読む解答のために fd 0 も入力のファイルに向ける
+    f = state.setdefault("stdin", tempfile.TemporaryFile())
+    f.seek(0)
+    f.truncate()
+    f.write(data)
+    f.flush()
+    os.dup2(f.fileno(), 0)
+    os.lseek(0, 0, os.SEEK_SET)
+
+
+def run_script(script, data, argv=()):
+    # 同じプロセスの中で __main__ として実行する、(出力, エラー) を返す
+    path, code = script
+    feed(data)
+    stdin, stdout, old_argv, limit = sys.stdin, sys.stdout, sys.argv, sys.getrecursionlimit()
+    out = io.BytesIO()
+    writer = io.TextIOWrapper(out, write_through=True)
+    sys.stdin = io.TextIOWrapper(io.BytesIO(data))
+    sys.stdout = writer
+    sys.argv = [path] + list(argv)
+    error = None
+    if state["timeout"]:
+        signal.setitimer(signal.ITIMER_REAL, state["timeout"])
+    try:
+        exec(code, {"__name__": "__main__", "__file__": path})
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            error = f"exit {e.code}"
+    except Timeout:
+        error = "TLE"
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        # 閉じられると中身が取れなくなるので、ラッパーから外しておく
+        writer.flush()
+        writer.detach()
+        sys.stdin, sys.stdout, sys.argv = stdin, stdout, old_argv
+        sys.setrecursionlimit(limit)
+    return out.getvalue(), error
+
+
+def run_solution(data):
+    solution = state["solution"]
+    if isinstance(solution, tuple):
+        return run_script(solution, data)
+    try:
+        p = subprocess.run(solution, input=data, capture_output=True, timeout=state["timeout"] or None)
+    except subprocess.TimeoutExpired:
+        return b"", "TLE"
+    return p.stdout, f"exit {p.returncode}" if p.returncode else None
+
+
+def generate(seed, size):
+    random.seed(seed)
+    data, error = run_script(state["gen"], b"", [str(seed)] + ([str(size)] if size else []))
+    if error:
+        raise Exception(f"generator failed (seed {seed}): {error}")
+    return data
+
+
+def check(data):
+    # 食い違えば (期待, 実際, 理由)、揃っているか愚直解が落ちれば None
+    expected, error = run_script(state["naive"], data)
+    if error:
+        return None
+    actual, error = run_solution(data)
+    if error:
+        return expected, actual, error
+    ok, i = sample_runner.compare(expected, actual, *state["tol"])
+    if ok:
+        return None
+    return expected, actual, f"token {i}: expected {sample_runner.token(expected.split(), i)}, got {sample_runner.token(actual.split(), i)}"
+
+
+def run_batch(args):
+    # seeds を順に試して、最初に食い違ったものを返す
+    seeds, size = args
+    for seed in seeds:
+        data = generate(seed, size)
+        found = check(data)
+        if found is not None:
+            return seed, data, found
+    return None
+
+
+def search(pool, window, start, n, size=None, label="stress"):
+    # [start, start + n) の seed を並列に試す、(試した数, 見つかったもの)
+    # 同時に投げるのは window バッチまで (見つかったら残りを投げずに戻る、後ろの探索や縮小を待たせない)
+    from collections import deque
+    batches = iter([(list(range(s, min(start + n, s + BATCH))), size) for s in range(start, start + n, BATCH)])
+    pending = deque()
+
+    def submit():
+        batch = next(batches, None)
+        if batch is not None:
+            pending.append(pool.apply_async(run_batch, (batch,)))
+
+    for _ in range(window):
+        submit()
+    begin = shown = time.perf_counter()
+    tried = 0
+    while pending:
+        result = pending.popleft().get()
+        tried += BATCH
+        if result is not None:
+            return tried, result
+        submit()
+        now = time.perf_counter()
+        elapsed = now - begin
+        if label is not None and now - shown > 0.2:
+            shown = now
+            sys.stderr.write(f"\r[{label}] {min(tried, n)}/{n} ({min(tried, n) / max(elapsed, 1e-9):.0f} cases/s)\033[K")
+            sys.stderr.flush()
+    if label is not None:
+        sys.stderr.write("\n")
+    return n, None
+
+
+def ddmin(items, interesting, budget):
+    # items (行) の部分列で interesting なまま小さくする
+    n = 2
+    while len(items) >= 2 and budget[0] > 0:
+        chunk = math.ceil(len(items) / n)
+        for i in range(0, len(items), chunk):
+            complement = items[:i] + items[i + chunk:]
+            if complement and interesting(complement):
+                items = complement
+                n = max(n - 1, 2)
+                break
+        else:
+            if n >= len(items):
+                break
+            n = min(n * 2, len(items))
+    return items
+
+
+def shrink(data):
+    budget = [SHRINK_LIMIT]
+
+    def interesting(lines):
+        budget[0] -= 1
+        return check(b"\n".join(lines) + b"\n") is not None
+
+    lines = data.rstrip(b"\n").split(b"\n")
+    lines = ddmin(lines, interesting, budget)
+    return b"\n".join(lines) + b"\n"
+
+
+def save(test_dir, data, expected):
+    test_dir = Path(test_dir)
+    test_dir.mkdir(parents=True, exist_ok=True)
+    k = 1
+    while (test_dir / f"stress-{k}.in").exists():
+        k += 1
+    (test_dir / f"stress-{k}.in").write_bytes(data)
+    (test_dir / f"stress-{k}.out").write_bytes(expected)
+    return test_dir / f"stress-{k}.in"
+
+
+def main(gen, naive, solution, test_dir, n, parallel, timeout=2.0, abs_tol=0.0, rel_tol=0.0):
+    # 食い違いが見つかって保存したら True
+    import multiprocessing
+    args = (str(gen), str(naive), solution, timeout, abs_tol, rel_tol)
+    with multiprocessing.Pool(parallel, initializer=init, initargs=args) as pool:
+        init(*args)
+        window = 2 * parallel
+        tried, found = search(pool, window, 0, n)
+        if found is None:
+            print(f"no counterexample in {tried} cases")
+            return False
+        seed, data, _ = found
+        print(f"counterexample: seed {seed} ({len(data)} bytes)")
+
+        # サイズの目安を 1, 2, 4, ... と上げていき、最初に食い違った大きさのケースに乗り換える
+        # (生成器がサイズを使っていなければ小さくならないので、短くなったときだけ)
+        for size in [1 << k for k in range(20)]:
+            _, smaller = search(pool, window, seed + 1, SIZE_TRIES, size=size, label=None)
+            if smaller is not None:
+                if len(smaller[1]) < len(data):
+                    seed, data = smaller[0], smaller[1]
+                break
+        pool.terminate()
+
+    # fd 0 を入力のファイルに向けるので、終わったら戻す
+    saved = os.dup(0)
+    try:
+        data = shrink(data)
+        expected, actual, reason = check(data)
+    finally:
+        os.dup2(saved, 0)
+        os.close(saved)
+    path = save(test_dir, data, expected)
+    print(f"minimized ({len(data)} bytes): {reason}")
+    print(data.decode(errors="replace")[:2000].rstrip())
+    print(f"expected: {expected.decode(errors='replace')[:200].rstrip()}")
+    print(f"actual:   {actual.decode(errors='replace')[:200].rstrip()}")
+    print(f"saved to {path}")
+    return True
@@ -0,0 +1,82 @@
+import os
+import select
+import struct
+import time
+from pathlib import Path
+
+# inotify の定数 (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+EVENT = struct.Struct("iIII")
+
+DEBOUNCE = 0.05
+POLL_INTERVAL = 0.2
+
+
+def inotify(directory):
+    # エディタは別名で書いてから rename することがあるので、ファイルではなくディレクトリを見る
+    try:
+        import ctypes
+        libc = ctypes.CDLL("libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    fd = libc.inotify_init1(os.O_CLOEXEC)
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, str(directory).encode(), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+def read_names(fd):
+    data = os.read(fd, 1 << 16)
+    names = set()
+    i = 0
+    while i < len(data):
+        _, _, _, length = EVENT.unpack_from(data, i)
+        i += EVENT.size
+        names.add(data[i:i + length].rstrip(b"\0").decode(errors="replace"))
+        i += length
+    return names
+
+
+def wait_inotify(fd, name):
+    while True:
+        names = read_names(fd)
+        # 保存は何回かに分かれてイベントが来るので、少し待ってまとめる
+        while select.select([fd], [], [], DEBOUNCE)[0]:
+            names |= read_names(fd)
+        if name in names:
+            return
+
+
+def mtime(path):
+    try:
+        return Path(path).stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def wait_poll(path, last):
+    while True:
+        time.sleep(POLL_INTERVAL)
+        current = mtime(path)
+        if current is not None and current != last:
+            return current
+
+
+def watch(path, callback):
+    # path が保存されるたびに callback() を呼ぶ、inotify が使えなければ mtime を見る
+    path = Path(path)
+    fd = inotify(path.parent)
+    last = mtime(path)
+    callback()
+    while True:
+        if fd is not None:
+            wait_inotify(fd, path.name)
+        else:
+            last = wait_poll(path, last)
+        callback()